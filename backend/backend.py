@@ -1,11 +1,16 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+from startup import startup_timer  # first, so the import breakdown covers the framework too
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipMiddleware
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime
-import httpx
+from contextlib import asynccontextmanager
 import uuid
+import asyncio
+import base64
 import json
 import os
 from enum import Enum
@@ -13,26 +18,220 @@ from enum import Enum
 # Load environment variables FIRST
 from dotenv import load_dotenv
 load_dotenv()
+startup_timer.mark("import.framework")
 
-# --------- DEDALUS LABS ---------
-from dedalus_labs import AsyncDedalus
+# --------- LOGGING & METRICS ---------
+from logs import configure_logging, get_logger
+from metrics import MetricsMiddleware, render as render_metrics, span
+
+configure_logging()
+logger = get_logger("api")
 
-dedalus_client = AsyncDedalus()  # Reads DEDALUS_API_KEY from env
+# --------- DEDALUS LABS ---------
+# Imported here so pre-forked workers share it; the client itself is built in the lifespan
+from dedalus_labs import AsyncDedalus, DefaultAsyncHttpxClient
+startup_timer.mark("import.dedalus_labs")
 
 # --------- SUPABASE ---------
-from supabase import create_client, Client
+from supabase import create_client
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_KEY')
-supabase: Client = create_client(supabase_url, supabase_key)
+startup_timer.mark("import.supabase")
+
+from repos import Database, UserRepo, WorkoutRepo
+from profile_cache import ProfileCache
+
+db = Database()
+profile_cache = ProfileCache()
+user_repo = UserRepo(db, cache=profile_cache)
+workout_repo = WorkoutRepo(db)
+
+from write_behind import WriteBehindQueue
+
+write_behind = WriteBehindQueue(workout_repo)
+
+# --------- SHARED HTTP CLIENTS ---------
+from http_clients import ClientRegistry, HostConfig, shared_ssl_context
 
+WGER_BASE_URL = "https://wger.de/api/v2"
+http_clients = ClientRegistry()
+http_clients.register("wger", HostConfig(
+    base_url=WGER_BASE_URL,
+    connect_timeout=float(os.getenv("WGER_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.getenv("WGER_READ_TIMEOUT", "10")),
+    max_connections=int(os.getenv("WGER_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("WGER_MAX_KEEPALIVE", "10")),
+    retries=int(os.getenv("WGER_RETRIES", "2"))
+))
+
+# --------- WGER EXERCISE CATALOG ---------
+from catalog import ExerciseCatalog
+from media import MediaEnricher
+
+exercise_catalog = ExerciseCatalog(http_clients)
+media_enricher = MediaEnricher(http_clients, catalog=exercise_catalog)
+
+# --------- RULE-BASED PLANNER ---------
+from planner import WorkoutPlanner
+
+workout_planner = WorkoutPlanner(exercise_catalog)
+# Past this, generation gives up on the LLM and serves the rule-based plan
+LLM_LATENCY_BUDGET_SECONDS = float(os.getenv("LLM_LATENCY_BUDGET_SECONDS", "15"))
+
+# --------- LLM GATEWAY ---------
+from llm_gateway import LLMGateway, LLMUnavailable, Priority, RouteConfig
+
+llm_gateway = LLMGateway()
+llm_gateway.register("chat", RouteConfig(
+    concurrency=int(os.getenv("LLM_CHAT_CONCURRENCY", "24")),
+    deadline_seconds=30.0,
+    priority=Priority.INTERACTIVE,
+    hedge=True
+))
+llm_gateway.register("workout", RouteConfig(
+    concurrency=int(os.getenv("LLM_WORKOUT_CONCURRENCY", "16")),
+    deadline_seconds=LLM_LATENCY_BUDGET_SECONDS,
+    priority=Priority.STANDARD,
+    hedge=True
+))
+# Conversation summaries are refreshed in the background, never on a chat request
+llm_gateway.register("summary", RouteConfig(
+    concurrency=4,
+    deadline_seconds=20.0,
+    priority=Priority.BACKGROUND
+))
+llm_gateway.register("feedback", RouteConfig(
+    concurrency=4,
+    deadline_seconds=20.0,
+    priority=Priority.BACKGROUND
+))
+
+# --------- PROMPT BUILDER ---------
+from prompts import PromptBuilder, WORKOUT_SYSTEM_PROMPT
+from plan_stream import ExerciseStreamParser, strip_fences
+
+prompt_builder = PromptBuilder()
+
+# --------- FEEDBACK RECOMMENDATIONS ---------
+from recommendations import RecommendationWorkers
+
+# How long an SSE subscriber waits for the AI recommendation before giving up
+RECOMMENDATION_WAIT_SECONDS = float(os.getenv("RECOMMENDATION_WAIT_SECONDS", "30"))
+
+# --------- NEXT-WORKOUT PRE-GENERATION ---------
+from pregen import PREGEN_CONCURRENCY, PreGenerator
+
+# Speculative plans never compete with a waiting user for LLM slots
+llm_gateway.register("pregen", RouteConfig(
+    concurrency=PREGEN_CONCURRENCY,
+    deadline_seconds=60.0,
+    priority=Priority.BACKGROUND
+))
+
+# --------- PROGRESS STATS ---------
+from progress import ProgressRollups
+
+STATS_COLUMNS = ('workout_id', 'user_id', 'exercises', 'estimated_calories', 'completed', 'feedback', 'created_at')
+
+# --------- CHAT CONVERSATIONS ---------
+from conversations import ConversationManager
+
+# --------- CHAT IMAGE UPLOADS ---------
+from uploads import ImageStore, UploadSizeLimit
+
+image_store = ImageStore()
+
+# --------- WORKOUT PLAN CACHE ---------
+from plan_cache import PlanCache, plan_fingerprint
+
+plan_cache = PlanCache()
+
+# --------- HTTP CACHING ---------
+from http_cache import HTTP_COMPRESS_MIN_BYTES, PRIVATE_REVALIDATE, STATIC, HTTPCache, version_tag, without_exercises
+
+http_cache = HTTPCache()
+
+# --------- HEALTH PROBES ---------
+from health import HealthProber
+
+async def check_wger():
+    response = await http_clients.client("wger").get("/exercise/", params={"limit": 1})
+    response.raise_for_status()
+
+health_prober = HealthProber()
+health_prober.register(
+    "supabase",
+    user_repo.ping,
+    interval_seconds=float(os.getenv("HEALTH_SUPABASE_INTERVAL_SECONDS", "15"))
+)
+# The local catalog covers Wger outages, so it doesn't gate readiness
+health_prober.register(
+    "wger_api",
+    check_wger,
+    interval_seconds=float(os.getenv("HEALTH_WGER_INTERVAL_SECONDS", "60")),
+    critical=False
+)
+
+# --------- REQUEST COALESCING ---------
+from singleflight import SingleFlight
+
+exercise_flights = SingleFlight("wger_exercises")
+plan_flights = SingleFlight("workout_plans")
+
+def connect_clients():
+    """Build the Supabase and Dedalus clients in the process that uses them (i.e. after any fork)"""
+    if db.client is None:
+        if supabase_url and supabase_key:
+            db.client = create_client(supabase_url, supabase_key)
+        else:
+            logger.warning("SUPABASE_URL / SUPABASE_KEY not set; database calls will fail until configured")
+    if llm_gateway.client is None:
+        try:
+            # Reads DEDALUS_API_KEY from env
+            llm_gateway.client = AsyncDedalus(http_client=DefaultAsyncHttpxClient(verify=shared_ssl_context()))
+        except Exception as e:
+            logger.warning("Dedalus client unavailable; AI features fall back or return 503", extra={"error": str(e)})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services on boot and stop them on shutdown"""
+    with startup_timer.phase("clients"):
+        connect_clients()
+    with startup_timer.phase("http_clients"):
+        await http_clients.start()
+    with startup_timer.phase("exercise_catalog"):
+        await exercise_catalog.start()
+    with startup_timer.phase("write_behind"):
+        await write_behind.start()
+    with startup_timer.phase("background_workers"):
+        await image_store.start()
+        await recommendation_workers.start()
+        await health_prober.start()
+        await pregenerator.start()
+    startup_timer.ready()
+    logger.info("startup complete", extra=startup_timer.report())
+    yield
+    await pregenerator.stop()
+    await conversations.stop()
+    await health_prober.stop()
+    await recommendation_workers.stop()
+    await write_behind.stop()
+    await exercise_catalog.stop()
+    await http_clients.aclose()
+    await profile_cache.aclose()
+    db.shutdown()
+    await image_store.stop()
 
 # ------------------------ FastAPI ----------------------------
 app = FastAPI(
     title="Swole.ai",
     description="Supabase + Dedalus Labs + Wger integration",
-    version="3.0"
+    version="3.0",
+    lifespan=lifespan
 )
 
+# Innermost, so CORS headers still go on its 413s
+app.add_middleware(UploadSizeLimit, path="/api/uploads/images")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -40,8 +239,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compresses whatever the HTTP cache didn't already encode; streamed NDJSON/SSE must not be buffered
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=HTTP_COMPRESS_MIN_BYTES,
+    exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",)
+)
+app.add_middleware(MetricsMiddleware)
 
 # ------------------ Pydantic Models -----------------
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
 class Gender(str, Enum):
     MALE = "male"
     FEMALE = "female"
@@ -65,6 +274,10 @@ class WorkoutType(str, Enum):
     ABS = "abs"
     STRETCHING = "stretching"
 
+class GenerationMode(str, Enum):
+    AI = "ai"
+    FAST = "fast"
+
 class UserProfile(BaseModel):
     name: str
     age: int = Field(ge=13, le=120)
@@ -80,6 +293,10 @@ class WorkoutRequest(BaseModel):
     workout_type: WorkoutType
     duration_minutes: int = Field(default=30, ge=10, le=120)
     equipment_available: List[str] = []
+    mode: GenerationMode = GenerationMode.AI
+
+class BatchWorkoutRequest(BaseModel):
+    items: List[WorkoutRequest] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
 
 class WorkoutFeedback(BaseModel):
     workout_id: str
@@ -88,6 +305,16 @@ class WorkoutFeedback(BaseModel):
     enjoyed: bool
     notes: Optional[str] = None
 
+class HistoryFields(str, Enum):
+    SUMMARY = "summary"
+    FULL = "full"
+
+# Columns the history list needs when it doesn't render exercises
+SUMMARY_COLUMNS = (
+    'workout_id', 'user_id', 'workout_type', 'duration_minutes',
+    'estimated_calories', 'completed', 'created_at'
+)
+
 class ChatMessage(BaseModel):
     role: str
     content: str
@@ -95,9 +322,10 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     image: Optional[str] = None
+    image_id: Optional[str] = None  # from POST /api/uploads/images
+    conversation_id: Optional[str] = None
 
 # ------------------ Wger API Integration -----------------
-WGER_BASE_URL = "https://wger.de/api/v2"
 WORKOUT_CATEGORIES = {
     "cardio": [9],
     "upper_body": [8, 14, 12, 13],
@@ -113,226 +341,277 @@ WORKOUT_CATEGORIES = {
 }
 
 async def fetch_wger_exercises(workout_type: str, limit: int = 50) -> List[Dict]:
-    """Fetch exercises from Wger API"""
+    """Fetch exercises for a workout type, from the local catalog when it's loaded"""
     categories = WORKOUT_CATEGORIES.get(workout_type, [8, 9, 10])
-    all_exercises = []
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for category in categories:
-            try:
-                response = await client.get(
-                    f"{WGER_BASE_URL}/exercise/",
-                    params={"language": 2, "category": category, "limit": limit}
-                )
-                data = response.json()
-                all_exercises.extend(data.get("results", []))
-            except Exception as e:
-                print(f"Wger API error: {e}")
-    return all_exercises
+    if exercise_catalog.ready:
+        return exercise_catalog.for_categories(categories, limit)
 
+    # Catalog not synced yet (first boot, no snapshot) - ask Wger directly
+    all_exercises = []
 
-async def get_exercise_images(exercise_id: int) -> List[str]:
-    """Get image URLs for an exercise"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
+    client = http_clients.client("wger")
+    for category in categories:
         try:
             response = await client.get(
-                f"{WGER_BASE_URL}/exerciseimage/",
-                params={"exercise": exercise_id}
+                "/exercise/",
+                params={"language": 2, "category": category, "limit": limit},
+                timeout=30.0
             )
             data = response.json()
-            return [img.get("image") for img in data.get("results", [])]
-        except:
-            return []
+            all_exercises.extend(data.get("results", []))
+        except Exception as e:
+            logger.warning("wger API error", extra={"category": category, "error": str(e)})
+    return all_exercises
 
-async def get_exercise_videos(exercise_id: int) -> List[str]:
-    """Get video URLs for an exercise"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{WGER_BASE_URL}/exercisevideo/",
-                params={"exercise": exercise_id}
-            )
-            data = response.json()
-            return [vid.get("video") for vid in data.get("results", [])]
-        except:
-            return []
 
 # ------------- Dedalus Labs Workout Generation ---------------
+def attach_catalog_details(exercise: Dict, available_exercises: List[Dict]):
+    """Copy muscles, equipment and description from the catalog entry the LLM picked"""
+    matching_ex = next((ex for ex in available_exercises if ex.get("id") == exercise.get("id")), None)
+    if matching_ex:
+        exercise["muscles"] = [m.get("name") for m in matching_ex.get("muscles", [])]
+        exercise["equipment"] = [e.get("name") for e in matching_ex.get("equipment", [])]
+        exercise["description"] = matching_ex.get("description", "")
+
 async def generate_ai_workout(
     user_profile: Dict,
     workout_type: str,
     duration_minutes: int,
-    available_exercises: List[Dict]
+    available_exercises: List[Dict],
+    cache_key: Optional[str] = None,
+    equipment_available: Optional[List[str]] = None,
+    llm_route: str = "workout",
+    fallback: bool = True
 ) -> Dict:
     """Use Dedalus Labs to generate intelligent workout plan"""
 
-    exercise_list = []
-    for ex in available_exercises[:30]:
-        exercise_list.append({
-            "id": ex.get("id"),
-            "name": ex.get("name"),
-            "description": ex.get("description", "")[:100],
-            "category": ex.get("category", {}).get("name", ""),
-            "muscles": [m.get("name") for m in ex.get("muscles", [])],
-            "equipment": [e.get("name") for e in ex.get("equipment", [])]
-        })
-
-    prompt = f"""Create a personalized {duration_minutes}-minute workout.
-
-USER PROFILE:
-- Name: {user_profile['name']}
-- Age: {user_profile['age']}
-- Fitness Level: {user_profile['fitness_level']}
-- Goals: {', '.join(user_profile['goals'])}
-- Medical Conditions: {', '.join(user_profile.get('medical_conditions', [])) or 'None'}
-
-WORKOUT TYPE: {workout_type}
-
-AVAILABLE EXERCISES:
-{json.dumps(exercise_list, indent=2)}
-
-INSTRUCTIONS:
-1. Select 4-6 appropriate exercises from the list above
-2. Order them logically (warm-up → intense → cool-down)
-3. Assign sets, reps, and rest periods based on fitness level
-4. Provide 3-4 specific coaching cues per exercise
-5. Calculate estimated calories burned
-
-Return ONLY valid JSON with this structure:
-{{
-  "exercises": [
-    {{
-      "id": <exercise_id>,
-      "name": "<exercise_name>",
-      "sets": <number>,
-      "reps": <number>,
-      "rest_seconds": <number>,
-      "coaching_cues": ["<cue1>", "<cue2>", "<cue3>"],
-      "why_chosen": "<brief reason>"
-    }}
-  ],
-  "estimated_calories": <number>,
-  "workout_notes": "<motivational message>"
-}}"""
+    with span("prompt_build"):
+        prompt, prompt_stats = prompt_builder.build_workout_prompt(
+            user_profile,
+            workout_type,
+            duration_minutes,
+            available_exercises,
+            equipment_available
+        )
+    logger.info("workout prompt built", extra=prompt_stats)
 
     try:
-        print(f"🏋️ Generating workout with Dedalus Labs...")
-        
-        response = await dedalus_client.chat.completions.create(
-            model="openai/gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert personal trainer who creates safe, effective workouts. Return only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=2000
-        )
+        with span("llm"):
+            response = await llm_gateway.complete(
+                llm_route,
+                model="openai/gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": WORKOUT_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=2000
+            )
 
-        ai_response = response.choices[0].message.content.strip()
+        with span("json_parse"):
+            # Remove markdown if present
+            workout_plan = json.loads(strip_fences(response.choices[0].message.content))
 
-        # Remove markdown if present
-        if ai_response.startswith("```json"):
-            ai_response = ai_response.replace("```json", "").replace("```", "").strip()
-        if ai_response.startswith("```"):
-            ai_response = ai_response.replace("```", "").strip()
+        # Enrich with images and videos
+        with span("enrichment"):
+            await media_enricher.enrich(workout_plan["exercises"])
 
-        workout_plan = json.loads(ai_response)
+            for exercise in workout_plan["exercises"]:
+                attach_catalog_details(exercise, available_exercises)
 
-        # Enrich with images and videos
-        for exercise in workout_plan["exercises"]:
-            exercise_id = exercise["id"]
-            exercise["images"] = await get_exercise_images(exercise_id)
-            exercise["videos"] = await get_exercise_videos(exercise_id)
-
-            matching_ex = next((ex for ex in available_exercises if ex.get("id") == exercise_id), None)
-            if matching_ex:
-                exercise["muscles"] = [m.get("name") for m in matching_ex.get("muscles", [])]
-                exercise["equipment"] = [e.get("name") for e in matching_ex.get("equipment", [])]
-                exercise["description"] = matching_ex.get("description", "")
-
-        print(f"✅ Workout generated successfully")
+        logger.info("workout generated", extra={"exercises": len(workout_plan["exercises"])})
+        if cache_key:
+            plan_cache.put(cache_key, workout_plan)
         return workout_plan
 
+    except asyncio.TimeoutError:
+        if not fallback:
+            raise
+        logger.warning("LLM exceeded latency budget, using rule-based plan", extra={"budget_seconds": LLM_LATENCY_BUDGET_SECONDS})
+        return fallback_workout(available_exercises, workout_type, duration_minutes, user_profile, equipment_available)
+    except LLMUnavailable as e:
+        if not fallback:
+            raise
+        logger.warning("LLM unavailable, using rule-based plan", extra={"error": str(e)})
+        return fallback_workout(available_exercises, workout_type, duration_minutes, user_profile, equipment_available)
     except Exception as e:
-        print(f"❌ Dedalus Labs error: {e}")
-        return fallback_workout(available_exercises, duration_minutes, user_profile)
+        if not fallback:
+            raise
+        logger.error("workout generation failed, using rule-based plan", extra={"error": str(e)})
+        return fallback_workout(available_exercises, workout_type, duration_minutes, user_profile, equipment_available)
 
-def fallback_workout(exercises: List[Dict], duration: int, profile: Dict) -> Dict:
-    """Simple fallback if AI fails"""
-    import random
-
-    num_exercises = 4 if duration <= 30 else 6
-    selected = random.sample(exercises[:20], min(num_exercises, len(exercises)))
+def fallback_workout(
+    exercises: List[Dict],
+    workout_type: str,
+    duration: int,
+    profile: Dict,
+    equipment_available: Optional[List[str]] = None
+) -> Dict:
+    """Rule-based plan if AI fails (or is too slow)"""
+    return workout_planner.plan(
+        profile,
+        workout_type,
+        WORKOUT_CATEGORIES.get(workout_type, [8, 9, 10]),
+        duration,
+        equipment_available,
+        # The catalog index is faster; only plan from the raw list when it isn't loaded
+        exercises=None if exercise_catalog.ready else exercises
+    )
 
-    sets = 2 if profile['fitness_level'] == 'beginner' else 3
-    reps = 10 if profile['fitness_level'] == 'beginner' else 12
+# ---------------API Endpoints--------------------
 
-    return {
-        "exercises": [
-            {
-                "id": ex.get("id"),
-                "name": ex.get("name"),
-                "sets": sets,
-                "reps": reps,
-                "rest_seconds": 60,
-                "coaching_cues": ["Maintain proper form", "Control breathing", "Start light"],
-                "why_chosen": "Selected for balanced workout",
-                "images": [],
-                "videos": [],
-                "muscles": [m.get("name") for m in ex.get("muscles", [])],
-                "equipment": [e.get("name") for e in ex.get("equipment", [])]
-            }
-            for ex in selected
+async def summarize_conversation(previous_summary: str, turns: List[Dict]) -> str:
+    """Fold turns that left the chat window into the running summary"""
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    response = await llm_gateway.complete(
+        "summary",
+        model="openai/gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": (
+                "You maintain a running summary of a fitness coaching chat. Keep the user's goals, "
+                "injuries, preferences, plans and any decisions made. Stay under 150 words."
+            )},
+            {"role": "user", "content": f"""Current summary: {previous_summary or 'None'}
+
+New turns:
+{transcript}
+
+Return only the updated summary."""}
         ],
-        "estimated_calories": duration * 5,
-        "workout_notes": "Great workout ahead!"
-    }
+        max_tokens=250
+    )
+    return response.choices[0].message.content.strip()
+
+conversations = ConversationManager(summarize_conversation)
+
+def chat_client(http_request: Request) -> str:
+    """Who is chatting, for clients that don't send a conversation_id"""
+    host = http_request.client.host if http_request.client else ""
+    return f"{host}|{http_request.headers.get('user-agent', '')}"
+
+async def build_chat_messages(request: ChatRequest, http_request: Request) -> Tuple[Optional[str], List[Dict]]:
+    """Conversation id + system prompt and windowed history in OpenAI-compatible format"""
+    history = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+    windowed = conversations.window(request.conversation_id, history, client=chat_client(http_request))
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are Swole.ai, an expert AI fitness trainer. "
+                "You help users with workout plans, nutrition advice, exercise form, "
+                "and fitness goals. Be encouraging, knowledgeable, and concise."
+            )
+        }
+    ]
 
-# ---------------API Endpoints--------------------
+    # Add conversation history (rolling summary + recent turns)
+    messages.extend(windowed["messages"])
+
+    if request.image_id:
+        # Attach the uploaded photo to the latest user turn (never to the summary)
+        image_url = await asyncio.to_thread(image_store.data_url, request.image_id)
+        image = {"type": "image_url", "image_url": {"url": image_url}}
+        latest = next((m for m in reversed(messages) if m["role"] == "user"), None)
+        if latest is None:
+            messages.append({"role": "user", "content": [image]})
+        else:
+            latest["content"] = [{"type": "text", "text": latest["content"]}, image]
+    return windowed["conversation_id"], messages
 
 @app.post("/api/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """Chat with the AI fitness trainer using Dedalus Labs"""
     try:
-        print(f"📨 Chat request received: {len(request.messages)} messages")
-        
-        # Build messages array (OpenAI-compatible format)
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are Swole.ai, an expert AI fitness trainer. "
-                    "You help users with workout plans, nutrition advice, exercise form, "
-                    "and fitness goals. Be encouraging, knowledgeable, and concise."
-                )
-            }
-        ]
-        
-        # Add conversation history
-        for msg in request.messages:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        
-        print(f"🤖 Calling Dedalus Labs API...")
-        
+        logger.info("chat request", extra={"messages": len(request.messages)})
+
+        conversation_id, messages = await build_chat_messages(request, http_request)
+
         # Use standard chat completions API
-        response = await dedalus_client.chat.completions.create(
+        with span("llm"):
+            response = await llm_gateway.complete(
+                "chat",
+                model="openai/gpt-4o-mini",
+                messages=messages,
+                max_tokens=1024
+            )
+
+        content = response.choices[0].message.content
+        
+        return {"content": content, "conversation_id": conversation_id}
+
+    except HTTPException:
+        raise
+    except LLMUnavailable:
+        raise HTTPException(status_code=503, detail="The AI trainer is temporarily unavailable, please try again shortly")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The AI trainer took too long to respond")
+    except Exception as e:
+        logger.exception("chat error")
+        raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+def sse_event(data: Dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Chat with the AI trainer, relaying tokens as Server-Sent Events as they arrive"""
+    logger.info("streaming chat request", extra={"messages": len(request.messages)})
+
+    try:
+        conversation_id, messages = await build_chat_messages(request, http_request)
+        stream = await llm_gateway.stream(
+            "chat",
             model="openai/gpt-4o-mini",
             messages=messages,
             max_tokens=1024
         )
-        
-        content = response.choices[0].message.content
-        print(f"✅ Response received")
-        
-        return {"content": content}
-
+    except HTTPException:
+        raise
+    except LLMUnavailable:
+        raise HTTPException(status_code=503, detail="The AI trainer is temporarily unavailable, please try again shortly")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The AI trainer took too long to respond")
     except Exception as e:
-        import traceback
-        print(f"❌ Chat error: {traceback.format_exc()}")
+        logger.exception("chat stream error")
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+    async def events():
+        try:
+            async for chunk in stream:
+                if await http_request.is_disconnected():
+                    logger.info("client disconnected, cancelling upstream completion")
+                    return
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield sse_event({"content": delta})
+            yield sse_event({}, event="done")
+        except Exception as e:
+            logger.exception("chat stream error")
+            yield sse_event({"detail": f"Chat error: {str(e)}"}, event="error")
+        finally:
+            # Runs on normal completion, disconnect and task cancellation alike:
+            # closing the upstream response stops the LLM from generating further tokens
+            await stream.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Conversation-Id": conversation_id or ""
+        }
+    )
+
+@app.post("/api/uploads/images", status_code=201)
+async def upload_image(file: UploadFile = File(...)):
+    """Upload a chat photo; returns an image_id to pass to /api/chat"""
+    try:
+        return await image_store.save(file)
+    finally:
+        await file.close()
+
 @app.get("/")
 async def root():
     return {
@@ -352,7 +631,7 @@ async def create_user(profile: UserProfile):
     bmi = profile.weight_kg / ((profile.height_cm / 100) ** 2)
 
     try:
-        result = supabase.table('users').insert({
+        await user_repo.create({
             'user_id': user_id,
             'name': profile.name,
             'age': profile.age,
@@ -363,7 +642,7 @@ async def create_user(profile: UserProfile):
             'goals': profile.goals,
             'medical_conditions': profile.medical_conditions,
             'created_at': datetime.now().isoformat()
-        }).execute()
+        })
 
         return {
             "user_id": user_id,
@@ -373,21 +652,20 @@ async def create_user(profile: UserProfile):
         }
 
     except Exception as e:
-        print(f"Supabase error: {e}")
+        logger.exception("supabase error")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @app.get("/api/users/{user_id}")
-async def get_user(user_id: str):
+async def get_user(user_id: str, http_request: Request):
     """Get user profile from Supabase"""
 
     try:
-        result = supabase.table('users').select('*').eq('user_id', user_id).execute()
+        user = await user_repo.get(user_id)
 
-        if not result.data or len(result.data) == 0:
+        if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        user = result.data[0]
-        return {
+        return http_cache.json(http_request, {
             "user_id": user['user_id'],
             "name": user['name'],
             "age": user['age'],
@@ -397,79 +675,149 @@ async def get_user(user_id: str):
             "fitness_level": user['fitness_level'],
             "goals": user['goals'],
             "medical_conditions": user['medical_conditions']
-        }
+        }, PRIVATE_REVALIDATE)
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Supabase error: {e}")
+        logger.exception("supabase error")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+WORKOUT_TYPES = [
+    {"value": "cardio", "label": "Cardio", "description": "Heart-pumping cardiovascular exercises"},
+    {"value": "upper_body", "label": "Upper Body", "description": "Chest, back, shoulders, and arms"},
+    {"value": "lower_body", "label": "Lower Body", "description": "Legs, glutes, and calves"},
+    {"value": "full_body", "label": "Full Body", "description": "Complete workout hitting all muscle groups"},
+    {"value": "arms", "label": "Arms", "description": "Biceps and triceps focused"},
+    {"value": "legs", "label": "Legs", "description": "Quads, hamstrings, and calves"},
+    {"value": "chest", "label": "Chest", "description": "Pectoral muscle development"},
+    {"value": "back", "label": "Back", "description": "Lat and upper back training"},
+    {"value": "shoulders", "label": "Shoulders", "description": "Deltoid strengthening"},
+    {"value": "abs", "label": "Abs/Core", "description": "Core strength and stability"},
+    {"value": "stretching", "label": "Stretching", "description": "Flexibility and mobility"}
+]
+WORKOUT_TYPES_ETAG = version_tag(WORKOUT_TYPES)
+
 @app.get("/api/workout-types")
-async def get_workout_types():
+async def get_workout_types(http_request: Request):
     """Get available workout types"""
-    types = [
-        {"value": "cardio", "label": "Cardio", "description": "Heart-pumping cardiovascular exercises"},
-        {"value": "upper_body", "label": "Upper Body", "description": "Chest, back, shoulders, and arms"},
-        {"value": "lower_body", "label": "Lower Body", "description": "Legs, glutes, and calves"},
-        {"value": "full_body", "label": "Full Body", "description": "Complete workout hitting all muscle groups"},
-        {"value": "arms", "label": "Arms", "description": "Biceps and triceps focused"},
-        {"value": "legs", "label": "Legs", "description": "Quads, hamstrings, and calves"},
-        {"value": "chest", "label": "Chest", "description": "Pectoral muscle development"},
-        {"value": "back", "label": "Back", "description": "Lat and upper back training"},
-        {"value": "shoulders", "label": "Shoulders", "description": "Deltoid strengthening"},
-        {"value": "abs", "label": "Abs/Core", "description": "Core strength and stability"},
-        {"value": "stretching", "label": "Stretching", "description": "Flexibility and mobility"}
-    ]
-    return {"workout_types": types}
+    return http_cache.respond(http_request, WORKOUT_TYPES_ETAG, STATIC, lambda: {"workout_types": WORKOUT_TYPES})
 
-@app.post("/api/workouts/generate")
-async def generate_workout(request: WorkoutRequest):
-    """Generate AI-powered workout and save to Supabase"""
+def profile_from_user_row(user: Dict) -> Dict:
+    """The subset of a `users` row that shapes a workout"""
+    return {
+        "name": user['name'],
+        "age": user['age'],
+        "gender": user['gender'],
+        "weight_kg": user['weight_kg'],
+        "height_cm": user['height_cm'],
+        "fitness_level": user['fitness_level'],
+        "goals": user['goals'],
+        "medical_conditions": user.get('medical_conditions', [])
+    }
 
-    try:
-        user_result = supabase.table('users').select('*').eq('user_id', request.user_id).execute()
+async def plan_workout(
+    user_profile: Dict,
+    request: WorkoutRequest,
+    exercises: Optional[List[Dict]] = None,
+    llm_route: str = "workout",
+    fallback: bool = True
+) -> Dict:
+    """Cached, coalesced workout plan for a profile + request"""
+    if request.mode == GenerationMode.FAST and exercise_catalog.ready:
+        return workout_planner.plan(
+            user_profile,
+            request.workout_type.value,
+            WORKOUT_CATEGORIES.get(request.workout_type.value, [8, 9, 10]),
+            request.duration_minutes,
+            request.equipment_available
+        )
 
-        if not user_result.data or len(user_result.data) == 0:
-            raise HTTPException(status_code=404, detail="User not found")
+    cache_key = plan_fingerprint(
+        user_profile,
+        request.workout_type.value,
+        request.duration_minutes,
+        request.equipment_available
+    )
+    workout_plan = plan_cache.get(cache_key)
+    if workout_plan is not None:
+        return workout_plan
 
-        user = user_result.data[0]
-        user_profile = {
-            "name": user['name'],
-            "age": user['age'],
-            "gender": user['gender'],
-            "weight_kg": user['weight_kg'],
-            "height_cm": user['height_cm'],
-            "fitness_level": user['fitness_level'],
-            "goals": user['goals'],
-            "medical_conditions": user.get('medical_conditions', [])
-        }
+    available_exercises = exercises
+    if available_exercises is None:
+        with span("catalog_fetch"):
+            available_exercises = await exercise_flights.do(
+                request.workout_type.value,
+                lambda: fetch_wger_exercises(request.workout_type.value)
+            )
 
-        available_exercises = await fetch_wger_exercises(request.workout_type.value)
+    if not available_exercises:
+        raise HTTPException(status_code=404, detail="No exercises found")
 
-        if not available_exercises:
-            raise HTTPException(status_code=404, detail="No exercises found")
+    if request.mode == GenerationMode.FAST:
+        return fallback_workout(
+            available_exercises,
+            request.workout_type.value,
+            request.duration_minutes,
+            user_profile,
+            request.equipment_available
+        )
 
-        workout_plan = await generate_ai_workout(
+    # Identical requests arriving together share one LLM call, but only on the same route:
+    # a user must not end up waiting on a background pre-generation's priority and deadline
+    return await plan_flights.do(
+        (llm_route, cache_key),
+        lambda: generate_ai_workout(
             user_profile,
             request.workout_type.value,
             request.duration_minutes,
-            available_exercises
+            available_exercises,
+            cache_key=cache_key,
+            equipment_available=request.equipment_available,
+            llm_route=llm_route,
+            fallback=fallback
         )
+    )
+
+def workout_row(workout_id: str, request: WorkoutRequest, workout_plan: Dict) -> Dict:
+    return {
+        'workout_id': workout_id,
+        'user_id': request.user_id,
+        'workout_type': request.workout_type.value,
+        'duration_minutes': request.duration_minutes,
+        'exercises': workout_plan['exercises'],
+        'estimated_calories': workout_plan['estimated_calories'],
+        'workout_notes': workout_plan['workout_notes'],
+        'created_at': datetime.now().isoformat(),
+        'completed': False
+    }
+
+@app.post("/api/workouts/generate")
+async def generate_workout(request: WorkoutRequest):
+    """Generate AI-powered workout and save to Supabase"""
+
+    try:
+        with span("user_lookup"):
+            user = await user_repo.get(request.user_id)
+
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        user_profile = profile_from_user_row(user)
+        workout_plan = None
+        if request.mode == GenerationMode.AI and not request.equipment_available:
+            # Predicted and generated in the background after their last workout
+            workout_plan = pregenerator.take(request.user_id, request.workout_type.value, request.duration_minutes)
+        if workout_plan is None:
+            workout_plan = await plan_workout(user_profile, request)
 
         workout_id = str(uuid.uuid4())
 
-        supabase.table('workouts').insert({
-            'workout_id': workout_id,
-            'user_id': request.user_id,
-            'workout_type': request.workout_type.value,
-            'duration_minutes': request.duration_minutes,
-            'exercises': workout_plan['exercises'],
-            'estimated_calories': workout_plan['estimated_calories'],
-            'workout_notes': workout_plan['workout_notes'],
-            'created_at': datetime.now().isoformat(),
-            'completed': False
-        }).execute()
+        # Returned immediately; the row reaches Supabase on the next write-behind flush
+        with span("insert"):
+            row = workout_row(workout_id, request, workout_plan)
+            write_behind.enqueue_insert(row)
+            progress_rollups.record_workout(row)
 
         return {
             "workout_id": workout_id,
@@ -482,21 +830,263 @@ async def generate_workout(request: WorkoutRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("request failed")
         raise HTTPException(status_code=500, detail=f"Error generating workout: {str(e)}")
 
+async def enrich_streamed_exercise(exercise: Dict, available_exercises: List[Dict]) -> Dict:
+    """Media and catalog details for one exercise as soon as the LLM has finished it"""
+    await media_enricher.enrich([exercise])
+    attach_catalog_details(exercise, available_exercises)
+    return exercise
+
+@app.post("/api/workouts/generate/stream")
+async def generate_workout_stream(request: WorkoutRequest, http_request: Request):
+    """Generate a workout, streaming each exercise as a Server-Sent Event as soon as it's ready"""
+
+    try:
+        with span("user_lookup"):
+            user = await user_repo.get(request.user_id)
+
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        user_profile = profile_from_user_row(user)
+        cache_key = plan_fingerprint(
+            user_profile,
+            request.workout_type.value,
+            request.duration_minutes,
+            request.equipment_available
+        )
+
+        # Plans that already exist in full go out in one burst
+        workout_plan = None
+        if request.mode == GenerationMode.FAST:
+            workout_plan = await plan_workout(user_profile, request)
+        else:
+            if not request.equipment_available:
+                workout_plan = pregenerator.take(request.user_id, request.workout_type.value, request.duration_minutes)
+            if workout_plan is None:
+                workout_plan = plan_cache.get(cache_key)
+
+        available_exercises = []
+        if workout_plan is None:
+            with span("catalog_fetch"):
+                available_exercises = await exercise_flights.do(
+                    request.workout_type.value,
+                    lambda: fetch_wger_exercises(request.workout_type.value)
+                )
+            if not available_exercises:
+                raise HTTPException(status_code=404, detail="No exercises found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("request failed")
+        raise HTTPException(status_code=500, detail=f"Error generating workout: {str(e)}")
+
+    workout = {
+        "workout_id": str(uuid.uuid4()),
+        "user_name": user_profile["name"],
+        "workout_type": request.workout_type.value,
+        "duration_minutes": request.duration_minutes
+    }
+
+    async def stream_llm_plan():
+        """Exercises as the LLM completes them, then the whole plan as the last item"""
+        with span("prompt_build"):
+            prompt, prompt_stats = prompt_builder.build_workout_prompt(
+                user_profile,
+                request.workout_type.value,
+                request.duration_minutes,
+                available_exercises,
+                request.equipment_available
+            )
+        logger.info("workout prompt built", extra=prompt_stats)
+
+        stream = await llm_gateway.stream(
+            "workout",
+            model="openai/gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": WORKOUT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=2000
+        )
+        try:
+            parser = ExerciseStreamParser()
+            async for chunk in stream:
+                if await http_request.is_disconnected():
+                    logger.info("client disconnected, cancelling workout generation")
+                    return
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    for exercise in parser.feed(delta):
+                        yield await enrich_streamed_exercise(exercise, available_exercises)
+        finally:
+            # Also runs on disconnect and cancellation, so the LLM stops generating
+            await stream.close()
+
+        with span("json_parse"):
+            plan = parser.plan()
+        # Anything the incremental parser couldn't pick out of an unexpected layout
+        for exercise in plan["exercises"][len(parser.exercises):]:
+            yield await enrich_streamed_exercise(exercise, available_exercises)
+        yield plan
+
+    async def events():
+        yield sse_event(workout, event="workout")
+        plan = workout_plan
+        streamed = 0
+        if plan is None:
+            started = asyncio.get_running_loop().time()
+            exercises: List[Dict] = []
+            try:
+                async for item in stream_llm_plan():
+                    if "exercises" in item:
+                        plan = {**item, "exercises": exercises}
+                        streamed = len(exercises)
+                        break
+                    if not exercises:
+                        logger.info("first exercise streamed", extra={
+                            "elapsed_ms": round((asyncio.get_running_loop().time() - started) * 1000, 1)
+                        })
+                    yield sse_event({"index": len(exercises), "exercise": item}, event="exercise")
+                    exercises.append(item)
+                else:
+                    # Client went away mid-generation
+                    return
+                plan_cache.put(cache_key, plan)
+                logger.info("workout generated", extra={"exercises": len(exercises), "streamed": True})
+            except Exception as e:
+                if exercises:
+                    # The client already has part of this plan; swapping in another would contradict it
+                    logger.exception("workout stream failed")
+                    yield sse_event({"detail": f"Error generating workout: {str(e)}"}, event="error")
+                    return
+                if isinstance(e, (asyncio.TimeoutError, LLMUnavailable)):
+                    logger.warning("LLM unavailable, using rule-based plan", extra={"error": str(e) or type(e).__name__})
+                else:
+                    logger.error("workout generation failed, using rule-based plan", extra={"error": str(e)})
+                plan = fallback_workout(
+                    available_exercises,
+                    request.workout_type.value,
+                    request.duration_minutes,
+                    user_profile,
+                    request.equipment_available
+                )
+
+        # Pre-built and fallback plans haven't been sent yet
+        for index, exercise in enumerate(plan["exercises"][streamed:], start=streamed):
+            yield sse_event({"index": index, "exercise": exercise}, event="exercise")
+
+        # The row reaches Supabase on the next write-behind flush
+        with span("insert"):
+            row = workout_row(workout["workout_id"], request, plan)
+            write_behind.enqueue_insert(row)
+            progress_rollups.record_workout(row)
+        yield sse_event({**workout, **plan}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Workout-Id": workout["workout_id"]
+        }
+    )
+
+@app.post("/api/workouts/generate/batch")
+async def generate_workouts_batch(batch: BatchWorkoutRequest):
+    """Generate many workouts at once, streaming NDJSON results as each one completes"""
+
+    try:
+        user_ids = list({item.user_id for item in batch.items})
+        users = {user['user_id']: user for user in await user_repo.get_many(user_ids)}
+
+        # One catalog read per distinct workout type, shared by every item
+        workout_types = {item.workout_type.value for item in batch.items}
+        exercises_by_type = {
+            workout_type: await exercise_flights.do(
+                workout_type,
+                lambda workout_type=workout_type: fetch_wger_exercises(workout_type)
+            )
+            for workout_type in workout_types
+        }
+    except Exception as e:
+        logger.exception("request failed")
+        raise HTTPException(status_code=500, detail=f"Error generating workouts: {str(e)}")
+
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def generate_item(index: int, item: WorkoutRequest) -> Dict:
+        user = users.get(item.user_id)
+        if not user:
+            return {"index": index, "status": "error", "detail": "User not found"}
+
+        try:
+            user_profile = profile_from_user_row(user)
+            async with llm_slots:
+                workout_plan = await plan_workout(
+                    user_profile, item, exercises_by_type[item.workout_type.value]
+                )
+        except HTTPException as e:
+            return {"index": index, "status": "error", "detail": e.detail}
+        except Exception as e:
+            return {"index": index, "status": "error", "detail": f"Error generating workout: {str(e)}"}
+
+        workout_id = str(uuid.uuid4())
+        return {
+            "index": index,
+            "status": "ok",
+            "row": workout_row(workout_id, item, workout_plan),
+            "workout": {
+                "workout_id": workout_id,
+                "user_id": item.user_id,
+                "user_name": user_profile["name"],
+                "workout_type": item.workout_type.value,
+                "duration_minutes": item.duration_minutes,
+                **workout_plan
+            }
+        }
+
+    async def results():
+        tasks = [asyncio.create_task(generate_item(i, item)) for i, item in enumerate(batch.items)]
+        saved = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                row = result.pop("row", None)
+                if row:
+                    # Journaled before the client sees its workout_id, so a disconnect mid-batch
+                    # can't leave an "ok" pointing at nothing; the flusher still upserts in bulk
+                    write_behind.enqueue_insert(row)
+                    progress_rollups.record_workout(row)
+                    saved += 1
+                yield json.dumps(result) + "\n"
+
+            yield json.dumps({
+                "status": "done", "generated": saved, "failed": len(tasks) - saved, "saved": saved
+            }) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.get("/api/workouts/{workout_id}")
-async def get_workout(workout_id: str):
+async def get_workout(workout_id: str, http_request: Request):
     """Get workout details from Supabase"""
 
     try:
-        result = supabase.table('workouts').select('*').eq('workout_id', workout_id).execute()
+        workout = write_behind.pending_row(workout_id)
+        if workout is None:
+            workout = write_behind.with_pending_changes(await workout_repo.get(workout_id))
 
-        if not result.data or len(result.data) == 0:
+        if not workout:
             raise HTTPException(status_code=404, detail="Workout not found")
 
-        workout = result.data[0]
-        return {
+        # Revalidation only hashes the small columns; the exercises JSON isn't re-serialized for a 304
+        return http_cache.respond(http_request, version_tag(without_exercises(workout)), PRIVATE_REVALIDATE, lambda: {
             "workout_id": workout['workout_id'],
             "user_id": workout['user_id'],
             "workout_type": workout['workout_type'],
@@ -506,102 +1096,261 @@ async def get_workout(workout_id: str):
             "workout_notes": workout['workout_notes'],
             "completed": workout['completed'],
             "created_at": workout['created_at']
-        }
+        })
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Supabase error: {e}")
+        logger.exception("supabase error")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def rule_based_recommendation(feedback: WorkoutFeedback) -> str:
+    if feedback.difficulty_rating >= 8:
+        return "That was intense! Next time we'll dial it back for better recovery."
+    elif feedback.difficulty_rating <= 3:
+        return "You crushed it! Next workout, we'll increase the challenge."
+    return "Perfect intensity! Keep up the amazing work!"
+
+async def generate_recommendation(feedback: Dict) -> str:
+    """AI recommendation for a feedback submission (runs on the recommendation workers)"""
+    response = await llm_gateway.complete(
+        "feedback",
+        model="openai/gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a fitness coach giving brief feedback."},
+            {"role": "user", "content": f"""Based on this workout feedback, provide a brief (2-3 sentences) motivational recommendation:
+
+Completed: {feedback['completed']}
+Difficulty (1-10): {feedback['difficulty_rating']}
+Enjoyed: {feedback['enjoyed']}
+Notes: {feedback['notes'] or 'None'}"""}
+        ],
+        max_tokens=150
+    )
+    return response.choices[0].message.content
+
+recommendation_workers = RecommendationWorkers(generate_recommendation, write_behind.enqueue_update)
+
 @app.post("/api/workouts/{workout_id}/feedback")
 async def submit_feedback(workout_id: str, feedback: WorkoutFeedback):
-    """Submit workout feedback to Supabase with AI recommendation"""
+    """Submit workout feedback; the AI recommendation follows in the background"""
 
     try:
-        supabase.table('workouts').update({
+        recommendation = rule_based_recommendation(feedback)
+        write_behind.enqueue_update(workout_id, {
             'completed': feedback.completed,
             'feedback': {
                 'difficulty_rating': feedback.difficulty_rating,
                 'enjoyed': feedback.enjoyed,
                 'notes': feedback.notes
             }
-        }).eq('workout_id', workout_id).execute()
-
-        # Generate AI recommendation
-        try:
-            response = await dedalus_client.chat.completions.create(
-                model="openai/gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a fitness coach giving brief feedback."},
-                    {"role": "user", "content": f"""Based on this workout feedback, provide a brief (2-3 sentences) motivational recommendation:
-
-Completed: {feedback.completed}
-Difficulty (1-10): {feedback.difficulty_rating}
-Enjoyed: {feedback.enjoyed}
-Notes: {feedback.notes or 'None'}"""}
-                ],
-                max_tokens=150
-            )
-            recommendation = response.choices[0].message.content
-
-        except:
-            if feedback.difficulty_rating >= 8:
-                recommendation = "That was intense! Next time we'll dial it back for better recovery."
-            elif feedback.difficulty_rating <= 3:
-                recommendation = "You crushed it! Next workout, we'll increase the challenge."
-            else:
-                recommendation = "Perfect intensity! Keep up the amazing work!"
+        })
+        # Its own update: the `recommendation` column comes from migrations/001, and if it's
+        # missing there, only this write is rejected, not the user's feedback
+        write_behind.enqueue_update(workout_id, {'recommendation': recommendation})
+        progress_rollups.record_feedback(workout_id, feedback.completed, feedback.difficulty_rating)
+        recommendation_workers.submit(workout_id, {
+            'completed': feedback.completed,
+            'difficulty_rating': feedback.difficulty_rating,
+            'enjoyed': feedback.enjoyed,
+            'notes': feedback.notes
+        }, fallback=recommendation)
+        if feedback.completed:
+            pregenerator.schedule(workout_id, feedback.difficulty_rating)
 
         return {
             "message": "Feedback recorded!",
-            "recommendation": recommendation
+            "recommendation": recommendation,
+            "recommendation_status": "pending",
+            "recommendation_url": f"/api/workouts/{workout_id}/recommendation"
         }
 
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("request failed")
         raise HTTPException(status_code=500, detail=f"Error submitting feedback: {str(e)}")
 
+async def stored_recommendation(workout_id: str) -> Dict:
+    """Recommendation state for a workout: the worker's view if it has one, else what's on the row"""
+    job = recommendation_workers.status(workout_id)
+    if job is not None:
+        return {"workout_id": workout_id, **job}
+
+    workout = write_behind.pending_row(workout_id)
+    if workout is None:
+        workout = write_behind.with_pending_changes(await workout_repo.get(workout_id))
+    if not workout:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    if not workout.get('recommendation'):
+        raise HTTPException(status_code=404, detail="No feedback submitted for this workout")
+    return {"workout_id": workout_id, "status": "ready", "recommendation": workout['recommendation']}
+
+@app.get("/api/workouts/{workout_id}/recommendation")
+async def get_recommendation(workout_id: str):
+    """Poll for the AI recommendation; `status` stays "pending" while it's being generated"""
+    try:
+        return await stored_recommendation(workout_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("supabase error")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.get("/api/workouts/{workout_id}/recommendation/stream")
+async def stream_recommendation(workout_id: str):
+    """Server-Sent Events: the current recommendation now, then the AI one when it lands"""
+    current = await stored_recommendation(workout_id)
+
+    async def events():
+        yield sse_event(current, event="recommendation")
+        if current["status"] == "pending":
+            final = await recommendation_workers.wait(workout_id, timeout=RECOMMENDATION_WAIT_SECONDS)
+            if final is not None and final["status"] != "pending":
+                yield sse_event({"workout_id": workout_id, **final}, event="recommendation")
+        yield sse_event({}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def encode_cursor(workout: Dict) -> str:
+    raw = json.dumps([workout['created_at'], workout['workout_id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, workout_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), str(workout_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def history_key(workout: Dict) -> Tuple[str, str]:
+    return workout['created_at'], workout['workout_id']
+
+# --------- NEXT-WORKOUT PRE-GENERATION ---------
+PREGEN_HISTORY_SIZE = 20
+
+async def pregeneration_context(workout_id: str) -> Optional[Tuple[str, Dict, Dict, List[Dict]]]:
+    """The user, the workout they just completed and their recent history (newest first)"""
+    completed = write_behind.pending_row(workout_id)
+    if completed is None:
+        completed = write_behind.with_pending_changes(await workout_repo.get(workout_id))
+    if not completed:
+        return None
+    user_id = completed['user_id']
+    user = await user_repo.get(user_id)
+    if not user:
+        return None
+
+    stored = await workout_repo.page_for_user(
+        user_id,
+        PREGEN_HISTORY_SIZE,
+        columns=('workout_id', 'workout_type', 'duration_minutes', 'created_at')
+    )
+    pending = write_behind.pending_rows_for_user(user_id)
+    pending_ids = {w['workout_id'] for w in pending}
+    history = pending + [w for w in stored if w['workout_id'] not in pending_ids]
+    history.sort(key=history_key, reverse=True)
+    return user_id, profile_from_user_row(user), completed, history[:PREGEN_HISTORY_SIZE]
+
+async def pregenerate_workout(user_id: str, user_profile: Dict, workout_type: str, duration_minutes: int) -> Dict:
+    request = WorkoutRequest(user_id=user_id, workout_type=workout_type, duration_minutes=duration_minutes)
+    # A rule-based stand-in would later be served as if the LLM had planned it; let pre-generation fail instead
+    return await plan_workout(user_profile, request, llm_route="pregen", fallback=False)
+
+def cached_workout(user_profile: Dict, workout_type: str, duration_minutes: int) -> Optional[Dict]:
+    return plan_cache.get(plan_fingerprint(user_profile, workout_type, duration_minutes, []))
+
+pregenerator = PreGenerator(pregeneration_context, pregenerate_workout, lookup=cached_workout)
+
 @app.get("/api/users/{user_id}/workouts")
-async def get_user_workouts(user_id: str, limit: int = 10):
-    """Get user's workout history from Supabase"""
+async def get_user_workouts(
+    user_id: str,
+    http_request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: HistoryFields = HistoryFields.FULL
+):
+    """Get a page of the user's workout history (newest first) from Supabase"""
+
+    before = decode_cursor(cursor) if cursor else None
+    columns = SUMMARY_COLUMNS if fields == HistoryFields.SUMMARY else ('*',)
 
     try:
-        result = supabase.table('workouts')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .limit(limit)\
-            .execute()
+        # One extra row tells us whether there is a next page
+        stored, stored_total = await asyncio.gather(
+            workout_repo.page_for_user(user_id, limit + 1, columns, before),
+            workout_repo.count_for_user(user_id)
+        )
 
-        return {
+        # Include workouts that haven't been flushed to Supabase yet
+        pending = write_behind.pending_rows_for_user(user_id)
+        pending_ids = {w['workout_id'] for w in pending}
+        candidates = [w for w in pending if not before or history_key(w) < before] + [
+            write_behind.with_pending_changes(w) for w in stored if w['workout_id'] not in pending_ids
+        ]
+        candidates.sort(key=history_key, reverse=True)
+
+        workouts = candidates[:limit]
+        if fields == HistoryFields.SUMMARY:
+            workouts = [{column: w.get(column) for column in SUMMARY_COLUMNS} for w in workouts]
+
+        page = {
             "user_id": user_id,
-            "total_workouts": len(result.data),
-            "workouts": result.data
+            "total_workouts": stored_total + len(pending),
+            "workouts": workouts,
+            "next_cursor": encode_cursor(workouts[-1]) if len(candidates) > limit else None
         }
+        etag = version_tag(
+            fields.value,
+            {**page, "workouts": [without_exercises(w) for w in workouts]}
+        )
+        return http_cache.respond(http_request, etag, PRIVATE_REVALIDATE, lambda: page)
 
     except Exception as e:
-        print(f"Supabase error: {e}")
+        logger.exception("supabase error")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+# --------- PROGRESS STATS ---------
+async def progress_rows(user_id: str) -> List[Dict]:
+    """Every workout of a user for a rollup backfill, unflushed writes included"""
+    stored = await workout_repo.all_for_user(user_id, STATS_COLUMNS)
+    pending = write_behind.pending_rows_for_user(user_id)
+    pending_ids = {w['workout_id'] for w in pending}
+    return pending + [write_behind.with_pending_changes(w) for w in stored if w['workout_id'] not in pending_ids]
+
+progress_rollups = ProgressRollups(progress_rows)
+
+@app.get("/api/users/{user_id}/stats")
+async def get_user_stats(user_id: str, http_request: Request):
+    """Training volume per muscle, weekly calories, difficulty trend and completion rate"""
+
+    try:
+        if not await user_repo.get(user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+
+        with span("stats"):
+            stats = await progress_rollups.get(user_id)
+        return http_cache.json(http_request, {"user_id": user_id, **stats}, PRIVATE_REVALIDATE)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("supabase error")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @app.get("/api/health")
 async def health_check():
-    """Check if all services are working"""
-
+    """Latest background probe results; never calls an upstream itself"""
+    failing = health_prober.failing()
+    critical = health_prober.failing(critical_only=True)
     health = {
-        "status": "healthy",
+        "status": "unhealthy" if critical else ("degraded" if failing else "healthy"),
         "timestamp": datetime.now().isoformat(),
-        "services": {}
+        "services": health_prober.snapshot()
     }
 
-    # Check Supabase
-    try:
-        supabase.table('users').select('count').limit(1).execute()
-        health["services"]["supabase"] = "connected"
-    except:
-        health["services"]["supabase"] = "error"
-        health["status"] = "unhealthy"
-
     # Check Dedalus Labs
     if os.getenv('DEDALUS_API_KEY'):
         health["services"]["dedalus_labs"] = "configured"
@@ -609,19 +1358,36 @@ async def health_check():
         health["services"]["dedalus_labs"] = "not configured"
         health["status"] = "unhealthy"
 
-    # Check Wger API
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{WGER_BASE_URL}/exercise/", params={"limit": 1})
-            if response.status_code == 200:
-                health["services"]["wger_api"] = "accessible"
-            else:
-                health["services"]["wger_api"] = "slow response"
-    except:
-        health["services"]["wger_api"] = "unreachable"
+    health["services"]["exercise_catalog"] = exercise_catalog.stats()
+    health["services"]["media_cache"] = media_enricher.cache.stats()
 
     return health
 
+@app.get("/api/health/live")
+async def liveness():
+    """The process is up and its event loop is responding"""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Ready to take traffic: every critical dependency passed its last probe"""
+    if not health_prober.ready():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not ready", "failing": health_prober.failing(critical_only=True)}
+        )
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/debug/startup")
+async def debug_startup():
+    """Import and lifespan time breakdown for this process"""
+    return startup_timer.report()
+
 @app.get("/api/debug/env")
 async def debug_env():
     """Check if environment variables are loaded"""
@@ -633,12 +1399,71 @@ async def debug_env():
         "supabase_key_exists": bool(os.getenv('SUPABASE_KEY'))
     }
 
+@app.get("/api/debug/plan-cache")
+async def debug_plan_cache():
+    """Workout plan cache hit/miss counters"""
+    return plan_cache.stats()
+
+@app.get("/api/debug/http-cache")
+async def debug_http_cache():
+    return http_cache.stats()
+
+@app.get("/api/debug/progress")
+async def debug_progress():
+    return progress_rollups.stats()
+
+@app.get("/api/debug/llm")
+async def debug_llm():
+    """LLM gateway concurrency, circuit state and latency per route"""
+    return llm_gateway.stats()
+
+@app.get("/api/debug/recommendations")
+async def debug_recommendations():
+    """Background feedback recommendation queue"""
+    return recommendation_workers.stats()
+
+@app.get("/api/debug/pregen")
+async def debug_pregen():
+    """Speculative next-workout generation: hits, misses and spend"""
+    return pregenerator.stats()
+
+@app.get("/api/debug/profile-cache")
+async def debug_profile_cache():
+    """User profile cache hit rates"""
+    return profile_cache.stats()
+
+@app.get("/api/debug/write-behind")
+async def debug_write_behind():
+    """Write-behind journal depth and flush counters"""
+    return write_behind.stats()
+
+@app.get("/api/debug/conversations")
+async def debug_conversations():
+    """Chat window / rolling summary stats"""
+    return conversations.stats()
+
+@app.get("/api/debug/prompts")
+async def debug_prompts():
+    """Workout prompt token usage"""
+    return prompt_builder.stats()
+
+@app.get("/api/debug/singleflight")
+async def debug_singleflight():
+    """How many upstream calls were coalesced"""
+    return {
+        exercise_flights.name: exercise_flights.stats(),
+        plan_flights.name: plan_flights.stats()
+    }
+
+@app.get("/api/debug/http-pools")
+async def debug_http_pools():
+    """Connection pool stats for the shared outbound HTTP clients"""
+    return http_clients.stats()
+
+startup_timer.mark("import.app")
+
 if __name__ == "__main__":
-    import uvicorn
-    print("\n" + "="*70)
-    print("  AI FITNESS TRAINER - Dedalus Labs Edition")
-    print("="*70)
-    print(f"\n  Server: http://localhost:8000")
-    print(f"  Docs: http://localhost:8000/docs")
-    print("\n" + "="*70 + "\n")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Same as `python serve.py`, without importing this module a second time
+    import sys
+    import serve
+    serve.main(sys.modules[__name__])
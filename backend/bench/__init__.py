@@ -0,0 +1 @@
+"""Benchmark harness: fake upstreams plus load scenarios (run from backend/: python -m bench.run)"""
@@ -0,0 +1,308 @@
+# bench/fakes.py
+"""Local stand-ins for Supabase, Wger and Dedalus with configurable latency and error injection"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+
+WGER_BASE_URL = "https://wger.de/api/v2"
+
+CATEGORIES = {8: "Arms", 9: "Legs", 10: "Abs", 11: "Chest", 12: "Back", 13: "Shoulders", 14: "Calves", 15: "Cardio"}
+MUSCLES = {
+    1: "Biceps", 2: "Shoulders", 3: "Serratus", 4: "Chest", 5: "Triceps", 6: "Abs", 7: "Calves",
+    8: "Glutes", 9: "Traps", 10: "Quads", 11: "Hamstrings", 12: "Lats", 13: "Brachialis", 14: "Obliques"
+}
+EQUIPMENT = {
+    1: "Barbell", 2: "SZ-Bar", 3: "Dumbbell", 4: "Gym mat", 5: "Swiss Ball",
+    6: "Pull-up bar", 7: "none (bodyweight exercise)", 8: "Bench", 9: "Incline bench", 10: "Kettlebell"
+}
+
+_PROMPT_ROW_RE = re.compile(r"^(\d+)\|([^|\n]*)\|", re.MULTILINE)
+
+
+@dataclass
+class Latency:
+    """`base` plus an exponential tail with mean `jitter`, in seconds"""
+    base: float = 0.0
+    jitter: float = 0.0
+
+    def sample(self) -> float:
+        return self.base + (random.expovariate(1 / self.jitter) if self.jitter > 0 else 0.0)
+
+
+@dataclass
+class Faults:
+    latency: Latency
+    error_rate: float = 0.0
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class InjectedError(Exception):
+    """Failure raised on purpose by a fake"""
+
+
+# ---------- exercise data ----------
+def make_exercises(count: int = 400, seed: int = 7) -> List[Dict]:
+    """Deterministic exercises in Wger's /exerciseinfo/ shape"""
+    rng = random.Random(seed)
+    exercises = []
+    for exercise_id in range(1, count + 1):
+        category_id = rng.choice(list(CATEGORIES))
+        muscles = rng.sample(list(MUSCLES), rng.randint(1, 2))
+        equipment = rng.sample(list(EQUIPMENT), rng.randint(1, 2))
+        name = f"{CATEGORIES[category_id]} Exercise {exercise_id}"
+        exercises.append({
+            "id": exercise_id,
+            "category": {"id": category_id, "name": CATEGORIES[category_id]},
+            "muscles": [{"id": m, "name": MUSCLES[m], "name_en": MUSCLES[m]} for m in muscles],
+            "muscles_secondary": [],
+            "equipment": [{"id": e, "name": EQUIPMENT[e]} for e in equipment],
+            "images": [{"image": f"https://wger.de/media/exercise-images/{exercise_id}/main.png"}],
+            "videos": [],
+            "translations": [{
+                "language": 2,
+                "name": name,
+                "description": f"<p>Controlled reps of {name.lower()}, keep your core braced.</p>"
+            }]
+        })
+    return exercises
+
+
+# ---------- Supabase ----------
+class _Query:
+    """The subset of the postgrest query builder that repos.py uses"""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.payload: Any = None
+        self.columns: tuple = ("*",)
+        self.filters: List = []
+        self.orders: List[tuple] = []
+        self.limit_to: Optional[int] = None
+        self.count: Optional[str] = None
+        self.head = False
+
+    def select(self, *columns, count: Optional[str] = None, head: bool = False):
+        self.columns = columns or ("*",)
+        self.count = count
+        self.head = head
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = ""):
+        self.op, self.payload = "upsert", payload
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, expression: str):
+        # Only the keyset cursor filter from WorkoutRepo.page_for_user
+        created_at, _, workout_id = re.findall(r'"([^"]*)"', expression)
+        self.filters.append(lambda row: (row["created_at"], row["workout_id"]) < (created_at, workout_id))
+        return self
+
+    def order(self, column, desc: bool = False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n: int):
+        self.limit_to = n
+        return self
+
+    def execute(self):
+        time.sleep(self.db.faults.latency.sample())
+        if self.db.faults.should_fail():
+            raise InjectedError("injected Supabase failure")
+        return self.db._execute(self)
+
+
+class FakeSupabase:
+    """Thread-safe in-memory tables behind a supabase-py shaped client"""
+
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.tables: Dict[str, Dict[str, Dict]] = {"users": {}, "workouts": {}}
+        self._keys = {"users": "user_id", "workouts": "workout_id"}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def _execute(self, q: _Query):
+        with self._lock:
+            rows = self.tables.setdefault(q.table, {})
+            key = self._keys.get(q.table, "id")
+
+            if q.op in ("insert", "upsert"):
+                payload = q.payload if isinstance(q.payload, list) else [q.payload]
+                for row in payload:
+                    if q.op == "insert" and row[key] in rows:
+                        raise InjectedError(f"duplicate key {row[key]}")
+                    rows[row[key]] = dict(row)
+                return SimpleNamespace(data=[dict(r) for r in payload], count=None)
+
+            matched = [r for r in rows.values() if all(f(r) for f in q.filters)]
+            if q.op == "update":
+                for row in matched:
+                    row.update(q.payload)
+                return SimpleNamespace(data=[dict(r) for r in matched], count=None)
+
+            for column, desc in reversed(q.orders):
+                matched.sort(key=lambda r: r.get(column) or "", reverse=desc)
+            total = len(matched)
+            if q.limit_to is not None:
+                matched = matched[:q.limit_to]
+            if q.head:
+                return SimpleNamespace(data=[], count=total)
+            if "*" not in q.columns:
+                matched = [{c: r.get(c) for c in q.columns} for r in matched]
+            return SimpleNamespace(data=[dict(r) for r in matched], count=total if q.count else None)
+
+
+# ---------- Wger ----------
+class FakeWgerTransport(httpx.AsyncBaseTransport):
+    """Serves /exerciseinfo/, /exercise/, /exerciseimage/ and /exercisevideo/ from generated data"""
+
+    def __init__(self, faults: Faults, exercises: Optional[List[Dict]] = None):
+        self.faults = faults
+        self.exercises = exercises if exercises is not None else make_exercises()
+        self.requests = 0
+
+    def _page(self, request: httpx.Request, items: List[Dict]) -> Dict:
+        params = {k: v[0] for k, v in parse_qs(request.url.query.decode()).items()}
+        limit = int(params.get("limit", 20))
+        offset = int(params.get("offset", 0))
+        next_url = None
+        if offset + limit < len(items):
+            next_params = urlencode({**params, "offset": offset + limit})
+            next_url = f"{WGER_BASE_URL}{request.url.path.removeprefix('/api/v2')}?{next_params}"
+        return {"count": len(items), "next": next_url, "results": items[offset:offset + limit]}
+
+    def _exercise(self, raw: Dict) -> Dict:
+        english = raw["translations"][0]
+        return {**raw, "name": english["name"], "description": english["description"]}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(self.faults.latency.sample())
+        if self.faults.should_fail():
+            return httpx.Response(503, json={"detail": "injected Wger failure"}, request=request)
+
+        path = request.url.path.removeprefix("/api/v2").rstrip("/") + "/"
+        params = {k: v[0] for k, v in parse_qs(request.url.query.decode()).items()}
+        if path == "/exerciseinfo/":
+            body = self._page(request, self.exercises)
+        elif path == "/exercise/":
+            items = self.exercises
+            if "category" in params:
+                items = [ex for ex in items if str(ex["category"]["id"]) == params["category"]]
+            body = self._page(request, [self._exercise(ex) for ex in items])
+        elif path in ("/exerciseimage/", "/exercisevideo/"):
+            field = "images" if path == "/exerciseimage/" else "videos"
+            exercise_id = int(params.get("exercise", 0))
+            match = next((ex for ex in self.exercises if ex["id"] == exercise_id), None)
+            body = {"results": match[field] if match else []}
+        else:
+            return httpx.Response(404, json={"detail": "Not found"}, request=request)
+        return httpx.Response(200, json=body, request=request)
+
+
+# ---------- Dedalus ----------
+def _workout_json(prompt: str) -> str:
+    offered = _PROMPT_ROW_RE.findall(prompt)[:5] or [("1", "Push Up")]
+    return json.dumps({
+        "exercises": [{
+            "id": int(exercise_id),
+            "name": name,
+            "sets": 3,
+            "reps": 10,
+            "rest_seconds": 60,
+            "coaching_cues": ["Brace your core", "Control the eccentric", "Breathe out on effort"],
+            "why_chosen": "Matches the requested focus"
+        } for exercise_id, name in offered],
+        "estimated_calories": 240,
+        "workout_notes": "Steady effort today, stay consistent!"
+    })
+
+
+class _Stream:
+    def __init__(self, chunks: List[str], token_latency: Latency):
+        self.chunks = chunks
+        self.token_latency = token_latency
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            if self.closed:
+                return
+            await asyncio.sleep(self.token_latency.sample())
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))], usage=None)
+
+    async def close(self):
+        self.closed = True
+
+
+class _Completions:
+    def __init__(self, owner: "FakeDedalus"):
+        self.owner = owner
+
+    async def create(self, model: str, messages: List[Dict], max_tokens: int = 1024, stream: bool = False, **kwargs):
+        owner = self.owner
+        owner.calls += 1
+        await asyncio.sleep(owner.faults.latency.sample())
+        if owner.faults.should_fail():
+            raise InjectedError("injected LLM failure")
+
+        prompt = messages[-1]["content"]
+        if not isinstance(prompt, str):
+            prompt = " ".join(part.get("text", "") for part in prompt if isinstance(part, dict))
+        if "AVAILABLE EXERCISES" in prompt:
+            content = _workout_json(prompt)
+        else:
+            content = "Keep your back neutral, drive through your heels and progress the load gradually. " * 3
+
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(str(m["content"])) for m in messages) // 4,
+            completion_tokens=len(content) // 4
+        )
+        if stream:
+            words = content.split(" ")
+            return _Stream([w + " " for w in words], owner.token_latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class FakeDedalus:
+    """AsyncDedalus stand-in: chat.completions.create, streaming included"""
+
+    def __init__(self, faults: Faults, token_latency: Latency):
+        self.faults = faults
+        self.token_latency = token_latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
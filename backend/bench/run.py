@@ -0,0 +1,331 @@
+# bench/run.py
+"""Load scenarios against the API, reporting p50/p95/p99 and RPS
+
+    python -m bench.run                                  # every scenario against a fresh fake-backed server
+    python -m bench.run generate_burst history -c 64 -n 500
+    python -m bench.run --save before.json               # record a baseline...
+    python -m bench.run --baseline before.json           # ...and compare a later run against it
+    python -m bench.run --url http://localhost:8000      # an already running server (fakes or real)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from bench.serve import BACKEND_DIR, add_fake_arguments, fake_arguments
+
+WORKOUT_TYPES = ["cardio", "upper_body", "lower_body", "full_body", "arms", "legs", "chest", "back", "shoulders", "abs"]
+FITNESS_LEVELS = ["beginner", "intermediate", "advanced"]
+GOALS = [["strength"], ["weight loss"], ["endurance"], ["muscle gain", "strength"], ["flexibility"]]
+
+
+@dataclass
+class Sample:
+    seconds: float
+    ok: bool
+    first_byte_seconds: Optional[float] = None
+
+
+@dataclass
+class Result:
+    scenario: str
+    requests: int
+    errors: int
+    elapsed_seconds: float
+    rps: float
+    latency_ms: Dict[str, float]
+    first_byte_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000, 1)
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(ordered[-1] * 1000, 1)}
+
+
+# ---------- scenarios ----------
+async def seed(call: Callable, attempts: int = 5) -> httpx.Response:
+    """Setup requests retry through injected errors; only measured requests may fail"""
+    for attempt in range(attempts):
+        response = await call()
+        if response.status_code < 500 or attempt == attempts - 1:
+            response.raise_for_status()
+            return response
+        await asyncio.sleep(0.1)
+
+
+class Scenario:
+    name = ""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.user_ids: List[str] = []
+
+    async def create_users(self, client: httpx.AsyncClient, count: int):
+        for i in range(count):
+            profile = {
+                "name": f"Bench User {i}",
+                "age": self.rng.randint(18, 70),
+                "gender": self.rng.choice(["male", "female", "other"]),
+                "weight_kg": round(self.rng.uniform(50, 110), 1),
+                "height_cm": round(self.rng.uniform(150, 200), 1),
+                "fitness_level": self.rng.choice(FITNESS_LEVELS),
+                "goals": self.rng.choice(GOALS),
+                "medical_conditions": []
+            }
+            response = await seed(lambda: client.post("/api/users", json=profile))
+            self.user_ids.append(response.json()["user_id"])
+
+    async def setup(self, client: httpx.AsyncClient):
+        await self.create_users(client, 50)
+
+    async def request(self, client: httpx.AsyncClient) -> Sample:
+        raise NotImplementedError
+
+
+async def timed(call: Callable) -> Sample:
+    started = time.perf_counter()
+    try:
+        response = await call()
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    return Sample(time.perf_counter() - started, ok)
+
+
+class GenerateBurst(Scenario):
+    """AI workout generation: prompt build, LLM, enrichment and write-behind insert"""
+    name = "generate_burst"
+    mode = "ai"
+
+    async def request(self, client: httpx.AsyncClient) -> Sample:
+        return await timed(lambda: client.post("/api/workouts/generate", json={
+            "user_id": self.rng.choice(self.user_ids),
+            "workout_type": self.rng.choice(WORKOUT_TYPES),
+            "duration_minutes": self.rng.choice([20, 30, 45, 60]),
+            "mode": self.mode
+        }))
+
+
+class GenerateFast(GenerateBurst):
+    """Rule-based generation only, no LLM"""
+    name = "generate_fast"
+    mode = "fast"
+
+
+class ChatStream(Scenario):
+    """Streaming chat; also reports time to first byte"""
+    name = "chat_stream"
+
+    async def setup(self, client: httpx.AsyncClient):
+        pass
+
+    async def request(self, client: httpx.AsyncClient) -> Sample:
+        started = time.perf_counter()
+        first_byte = None
+        try:
+            async with client.stream("POST", "/api/chat/stream", json={"messages": [
+                {"role": "user", "content": self.rng.choice([
+                    "How do I fix my squat depth?",
+                    "What should I eat after a workout?",
+                    "Is it fine to train abs every day?"
+                ])}
+            ]}) as response:
+                async for _ in response.aiter_bytes():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        return Sample(time.perf_counter() - started, ok, first_byte)
+
+
+class HistoryReads(Scenario):
+    """Paged workout history for users with a few dozen workouts each"""
+    name = "history"
+
+    async def setup(self, client: httpx.AsyncClient):
+        await self.create_users(client, 10)
+        for user_id in self.user_ids:
+            for _ in range(30):
+                request = {
+                    "user_id": user_id,
+                    "workout_type": self.rng.choice(WORKOUT_TYPES),
+                    "duration_minutes": 30,
+                    "mode": "fast"
+                }
+                await seed(lambda: client.post("/api/workouts/generate", json=request))
+        # Let the write-behind queue flush so reads hit the table, not the overlay
+        await asyncio.sleep(2)
+
+    async def request(self, client: httpx.AsyncClient) -> Sample:
+        return await timed(lambda: client.get(
+            f"/api/users/{self.rng.choice(self.user_ids)}/workouts",
+            params={"limit": 20, "fields": self.rng.choice(["summary", "full"])}
+        ))
+
+
+SCENARIOS = {s.name: s for s in (GenerateBurst, GenerateFast, ChatStream, HistoryReads)}
+
+
+async def run_scenario(
+    scenario: Scenario,
+    client: httpx.AsyncClient,
+    requests: int,
+    concurrency: int,
+    warmup: int
+) -> Result:
+    await scenario.setup(client)
+    for _ in range(warmup):
+        await scenario.request(client)
+
+    samples: List[Sample] = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            samples.append(await scenario.request(client))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = [s for s in samples if s.ok]
+    return Result(
+        scenario=scenario.name,
+        requests=len(samples),
+        errors=len(samples) - len(ok),
+        elapsed_seconds=round(elapsed, 3),
+        rps=round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        latency_ms=percentiles([s.seconds for s in ok]),
+        first_byte_ms=percentiles([s.first_byte_seconds for s in ok if s.first_byte_seconds is not None])
+    )
+
+
+# ---------- reporting ----------
+def _delta(now: float, before: Optional[float]) -> str:
+    if not before:
+        return ""
+    return f" ({(now - before) / before * 100:+.0f}%)"
+
+
+def report(results: List[Result], baseline: Dict[str, Dict]):
+    print(f"\n{'scenario':<16}{'reqs':>6}{'errs':>6}{'rps':>16}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}")
+    for r in results:
+        before = baseline.get(r.scenario, {})
+        before_latency = before.get("latency_ms", {})
+        row = f"{r.scenario:<16}{r.requests:>6}{r.errors:>6}"
+        row += f"{str(r.rps) + _delta(r.rps, before.get('rps')):>16}"
+        for p in ("p50", "p95", "p99"):
+            value = r.latency_ms.get(p)
+            cell = "-" if value is None else f"{value}{_delta(value, before_latency.get(p))}"
+            row += f"{cell:>18}"
+        print(row)
+        if r.first_byte_ms:
+            print(f"{'  first byte':<28}{'':>16}" + "".join(
+                f"{r.first_byte_ms[p]:>18}" for p in ("p50", "p95", "p99")
+            ))
+    print()
+
+
+# ---------- server ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/workout-types")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout:.0f}s")
+
+
+def start_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bench.serve", "--port", str(port), *fake_arguments(args)],
+        cwd=BACKEND_DIR
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def main_async(args: argparse.Namespace) -> List[Result]:
+    process = None
+    url = args.url
+    if not url:
+        process, url = start_server(args)
+    try:
+        await _wait_ready(url)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        results = []
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+            for name in args.scenarios or list(SCENARIOS):
+                scenario = SCENARIOS[name](random.Random(args.seed))
+                print(f"▶ {name}: {args.requests} requests, concurrency {args.concurrency}")
+                results.append(await run_scenario(scenario, client, args.requests, args.concurrency, args.warmup))
+        return results
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"any of: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--url", help="benchmark this server instead of starting one with fakes")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --save")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+
+    results = asyncio.run(main_async(args))
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": time.time(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("save", "baseline")},
+                "results": [asdict(r) for r in results]
+            }, f, indent=2)
+        print(f"Saved results to {os.path.abspath(args.save)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench/serve.py
+"""Run the API against the local fakes: python -m bench.serve [--llm-latency-ms 800 ...]"""
+import argparse
+import dataclasses
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser):
+    """Latency / error knobs shared with bench.run"""
+    group = parser.add_argument_group("fakes")
+    group.add_argument("--supabase-latency-ms", type=float, default=15.0)
+    group.add_argument("--supabase-jitter-ms", type=float, default=5.0)
+    group.add_argument("--supabase-error-rate", type=float, default=0.0)
+    group.add_argument("--wger-latency-ms", type=float, default=80.0)
+    group.add_argument("--wger-jitter-ms", type=float, default=40.0)
+    group.add_argument("--wger-error-rate", type=float, default=0.0)
+    group.add_argument("--llm-latency-ms", type=float, default=800.0)
+    group.add_argument("--llm-jitter-ms", type=float, default=400.0)
+    group.add_argument("--llm-token-ms", type=float, default=15.0, help="delay between streamed chunks")
+    group.add_argument("--llm-error-rate", type=float, default=0.0)
+    group.add_argument("--exercises", type=int, default=400, help="size of the fake Wger catalog")
+
+
+def fake_arguments(args: argparse.Namespace) -> list:
+    """The fake knobs of `args` as command-line flags again, for spawning a server"""
+    flags = []
+    for action in build_parser()._actions:
+        if action.dest in ("help", "host", "port"):
+            continue
+        flags += [action.option_strings[0], str(getattr(args, action.dest))]
+    return flags
+
+
+def _isolate_state():
+    """Keep the run's journal, snapshots and plan cache out of the real data directory"""
+    state_dir = tempfile.mkdtemp(prefix="swole-bench-")
+    os.environ.setdefault("WRITE_BEHIND_PATH", os.path.join(state_dir, "write_behind.sqlite3"))
+    os.environ.setdefault("WGER_CATALOG_PATH", os.path.join(state_dir, "wger_catalog.json"))
+    os.environ.setdefault("PLAN_CACHE_BACKEND", "memory")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(state_dir, "uploads"))
+    # The fakes are installed before the lifespan builds real clients; this only makes /api/health report the LLM as configured
+    os.environ.setdefault("DEDALUS_API_KEY", "bench")
+    os.environ["REDIS_URL"] = ""
+    # A JSON access log line per request would skew the numbers
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def install_fakes(args: argparse.Namespace):
+    """Import the app and swap every upstream for its fake; returns the backend module"""
+    from bench.fakes import FakeDedalus, FakeSupabase, FakeWgerTransport, Faults, Latency, make_exercises
+
+    _isolate_state()
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import backend
+
+    ms = 1 / 1000
+    backend.db.client = FakeSupabase(Faults(
+        Latency(args.supabase_latency_ms * ms, args.supabase_jitter_ms * ms), args.supabase_error_rate
+    ))
+    backend.http_clients.register("wger", dataclasses.replace(
+        backend.http_clients.config("wger"),
+        transport=FakeWgerTransport(
+            Faults(Latency(args.wger_latency_ms * ms, args.wger_jitter_ms * ms), args.wger_error_rate),
+            make_exercises(args.exercises)
+        )
+    ))
+    backend.llm_gateway.client = FakeDedalus(
+        Faults(Latency(args.llm_latency_ms * ms, args.llm_jitter_ms * ms), args.llm_error_rate),
+        token_latency=Latency(args.llm_token_ms * ms)
+    )
+    return backend
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_fake_arguments(parser)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    backend = install_fakes(args)
+
+    import uvicorn
+    uvicorn.run(backend.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# catalog.py
+"""Local Wger exercise catalog: on-disk snapshot + in-memory indexes"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from http_clients import ClientRegistry
+from logs import get_logger
+
+logger = get_logger("catalog")
+
+WGER_LANGUAGE_EN = 2
+
+CATALOG_PATH = os.getenv(
+    "WGER_CATALOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "wger_catalog.json")
+)
+CATALOG_TTL_SECONDS = int(os.getenv("WGER_CATALOG_TTL_SECONDS", str(24 * 3600)))
+CATALOG_RETRY_SECONDS = int(os.getenv("WGER_CATALOG_RETRY_SECONDS", "300"))
+# How often a worker that doesn't sync itself checks whether the snapshot was replaced
+CATALOG_POLL_SECONDS = 30
+CATALOG_PAGE_SIZE = 200
+CATALOG_SYNC_TIMEOUT = 30.0
+
+
+def normalize_exercise(raw: Dict) -> Optional[Dict]:
+    """Flatten a Wger /exerciseinfo/ record into the shape the rest of the app uses"""
+    name = raw.get("name")
+    description = raw.get("description", "")
+
+    if not name:
+        for translation in raw.get("translations", []):
+            if translation.get("language") == WGER_LANGUAGE_EN:
+                name = translation.get("name")
+                description = translation.get("description", "")
+                break
+    if not name:
+        return None
+
+    category = raw.get("category") or {}
+    return {
+        "id": raw.get("id"),
+        "name": name,
+        "description": description or "",
+        "category": {"id": category.get("id"), "name": category.get("name", "")},
+        "muscles": [
+            {"id": m.get("id"), "name": m.get("name_en") or m.get("name")}
+            for m in raw.get("muscles", [])
+        ],
+        "muscles_secondary": [
+            {"id": m.get("id"), "name": m.get("name_en") or m.get("name")}
+            for m in raw.get("muscles_secondary", [])
+        ],
+        "equipment": [
+            {"id": e.get("id"), "name": e.get("name")}
+            for e in raw.get("equipment", [])
+        ],
+        "images": [img.get("image") for img in raw.get("images", []) if img.get("image")],
+        "videos": [vid.get("video") for vid in raw.get("videos", []) if vid.get("video")],
+    }
+
+
+class ExerciseCatalog:
+    """Whole Wger exercise set, loaded from disk and refreshed in the background on a TTL"""
+
+    def __init__(
+        self,
+        http: ClientRegistry,
+        path: str = CATALOG_PATH,
+        ttl_seconds: int = CATALOG_TTL_SECONDS
+    ):
+        self.http = http
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.synced_at = 0.0
+        self.last_error: Optional[str] = None
+        # False in pre-forked workers other than the one that syncs: they only reload its snapshot
+        self.syncs = True
+        self._snapshot_mtime = 0.0
+
+        self.exercises: Dict[int, Dict] = {}
+        self.by_category: Dict[int, List[int]] = {}
+        self.by_muscle: Dict[str, List[int]] = {}
+        self.by_equipment: Dict[str, List[int]] = {}
+
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._sync_lock = asyncio.Lock()
+
+    # ---------- state ----------
+    @property
+    def ready(self) -> bool:
+        return bool(self.exercises)
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self.synced_at >= self.ttl_seconds
+
+    def _install(self, exercises: Iterable[Dict], synced_at: float):
+        """Build fresh indexes and swap them in at once so readers never see a half-built catalog"""
+        by_id: Dict[int, Dict] = {}
+        by_category: Dict[int, List[int]] = {}
+        by_muscle: Dict[str, List[int]] = {}
+        by_equipment: Dict[str, List[int]] = {}
+
+        for ex in exercises:
+            ex_id = ex["id"]
+            by_id[ex_id] = ex
+            category_id = ex["category"].get("id")
+            if category_id is not None:
+                by_category.setdefault(category_id, []).append(ex_id)
+            for muscle in ex["muscles"] + ex.get("muscles_secondary", []):
+                if muscle.get("name"):
+                    by_muscle.setdefault(muscle["name"].lower(), []).append(ex_id)
+            for equipment in ex["equipment"]:
+                if equipment.get("name"):
+                    by_equipment.setdefault(equipment["name"].lower(), []).append(ex_id)
+
+        self.exercises = by_id
+        self.by_category = by_category
+        self.by_muscle = by_muscle
+        self.by_equipment = by_equipment
+        self.synced_at = synced_at
+
+    # ---------- disk snapshot ----------
+    def _snapshot_changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime != self._snapshot_mtime
+        except FileNotFoundError:
+            return False
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("could not read exercise catalog snapshot", extra={"error": str(e)})
+            return None
+        self._snapshot_mtime = mtime
+        return snapshot
+
+    def load(self) -> bool:
+        """Load the on-disk snapshot into memory"""
+        snapshot = self._read()
+        if snapshot is None:
+            return False
+
+        self._install(snapshot.get("exercises", []), snapshot.get("synced_at", 0.0))
+        logger.info("loaded exercise catalog snapshot", extra={"exercises": len(self.exercises)})
+        return True
+
+    def _save(self, exercises: List[Dict], synced_at: float):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Written aside and renamed over the old one, so a reader never sees a partial file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"synced_at": synced_at, "exercises": exercises}, f)
+        os.replace(tmp_path, self.path)
+        self._snapshot_mtime = os.stat(self.path).st_mtime
+
+    # ---------- Wger sync ----------
+    async def _download(self, client: httpx.AsyncClient) -> List[Dict]:
+        exercises = []
+        url = "/exerciseinfo/"
+        params: Optional[Dict] = {"language": WGER_LANGUAGE_EN, "limit": CATALOG_PAGE_SIZE}
+
+        while url:
+            response = await client.get(url, params=params, timeout=CATALOG_SYNC_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+            for raw in data.get("results", []):
+                ex = normalize_exercise(raw)
+                if ex:
+                    exercises.append(ex)
+            # "next" already carries the query string
+            url = data.get("next")
+            params = None
+        return exercises
+
+    async def sync(self) -> bool:
+        """Download the full exercise set from Wger, persist it and swap it in"""
+        async with self._sync_lock:
+            try:
+                exercises = await self._download(self.http.client("wger"))
+                if not exercises:
+                    raise ValueError("Wger returned no exercises")
+
+                synced_at = time.time()
+                await asyncio.to_thread(self._save, exercises, synced_at)
+                self._install(exercises, synced_at)
+                self.last_error = None
+                logger.info("exercise catalog synced", extra={"exercises": len(exercises)})
+                return True
+
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("exercise catalog sync failed, keeping previous snapshot", extra={"error": str(e)})
+                return False
+
+    async def _refresh_loop(self):
+        while True:
+            if self.is_stale:
+                ok = await self.sync()
+                delay = self.ttl_seconds if ok else CATALOG_RETRY_SECONDS
+            else:
+                delay = self.synced_at + self.ttl_seconds - time.time()
+            await asyncio.sleep(max(delay, 1))
+
+    async def _follow_loop(self):
+        """Pick up the snapshot whenever the syncing worker replaces it"""
+        while True:
+            await asyncio.sleep(CATALOG_POLL_SECONDS)
+            if not self._snapshot_changed():
+                continue
+            snapshot = await asyncio.to_thread(self._read)
+            if snapshot is not None:
+                self._install(snapshot.get("exercises", []), snapshot.get("synced_at", 0.0))
+                logger.info("reloaded exercise catalog snapshot", extra={"exercises": len(self.exercises)})
+
+    def follow(self):
+        """Leave syncing to another process and reload its snapshot instead (pre-forked workers)"""
+        self.syncs = False
+
+    async def start(self):
+        """Load the snapshot (unless preloaded before fork) and start the background refresher"""
+        if not self.ready:
+            self.load()
+        if self._refresh_task is None:
+            loop = self._refresh_loop() if self.syncs else self._follow_loop()
+            self._refresh_task = asyncio.create_task(loop)
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    # ---------- lookups ----------
+    def get(self, exercise_id: int) -> Optional[Dict]:
+        return self.exercises.get(exercise_id)
+
+    def for_categories(self, categories: List[int], limit: int = 50) -> List[Dict]:
+        """Exercises for the given categories, at most `limit` per category"""
+        results = []
+        for category in categories:
+            ids = self.by_category.get(category, [])[:limit]
+            results.extend(self.exercises[ex_id] for ex_id in ids)
+        return results
+
+    def with_muscle(self, muscle: str) -> List[Dict]:
+        return [self.exercises[ex_id] for ex_id in self.by_muscle.get(muscle.lower(), [])]
+
+    def with_equipment(self, equipment: str) -> List[Dict]:
+        return [self.exercises[ex_id] for ex_id in self.by_equipment.get(equipment.lower(), [])]
+
+    def stats(self) -> Dict:
+        return {
+            "exercises": len(self.exercises),
+            "categories": len(self.by_category),
+            "muscles": len(self.by_muscle),
+            "equipment": len(self.by_equipment),
+            "synced_at": datetime.fromtimestamp(self.synced_at).isoformat() if self.synced_at else None,
+            "stale": self.is_stale,
+            "syncs": self.syncs,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,181 @@
+# conversations.py
+"""Token-bounded chat windows with a rolling summary of older turns, per conversation id"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from logs import get_logger
+from prompts import count_tokens, truncate_tokens
+
+logger = get_logger("conversations")
+
+CHAT_WINDOW_TOKENS = int(os.getenv("CHAT_WINDOW_TOKENS", "2000"))
+CHAT_MAX_CONVERSATIONS = int(os.getenv("CHAT_MAX_CONVERSATIONS", "10000"))
+CHAT_CONVERSATION_TTL_SECONDS = int(os.getenv("CHAT_CONVERSATION_TTL_SECONDS", str(24 * 3600)))
+
+# (previous summary, newly evicted turns) -> updated summary
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role + framing
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def latest_user_turn(messages: List[Dict]) -> int:
+    """Index of the last user message (the one being answered); the last message if there is none"""
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]["role"] == "user":
+            return i
+    return len(messages) - 1
+
+
+def derived_conversation_id(messages: List[Dict], client: str) -> Optional[str]:
+    """Stable id for clients that resend the whole history but no conversation_id: who + how it started"""
+    first = next((m["content"] for m in messages if m["role"] == "user"), None)
+    if first is None:
+        return None
+    return hashlib.blake2b(f"{client}\n{first}".encode(), digest_size=16).hexdigest()
+
+
+class ConversationState:
+    def __init__(self):
+        self.summary = ""
+        # How many of the client's messages are already folded into `summary`
+        self.summarized_count = 0
+        # Bumped when the client starts over, so a refresh for the old history is discarded
+        self.generation = 0
+        self.refreshing = False
+        self.updated_at = time.time()
+
+
+class ConversationManager:
+    """Keeps per-turn prompt size flat: recent turns verbatim, everything older as a summary"""
+
+    def __init__(
+        self,
+        summarize: Summarizer,
+        window_tokens: int = CHAT_WINDOW_TOKENS,
+        max_conversations: int = CHAT_MAX_CONVERSATIONS,
+        ttl_seconds: int = CHAT_CONVERSATION_TTL_SECONDS
+    ):
+        self.summarize = summarize
+        self.window_tokens = window_tokens
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._refreshes: Set[asyncio.Task] = set()
+        self.summaries_built = 0
+        self.summaries_failed = 0
+        self.truncated = 0
+
+    def _state(self, conversation_id: str) -> ConversationState:
+        state = self._states.get(conversation_id)
+        if state is None or time.time() - state.updated_at > self.ttl_seconds:
+            state = ConversationState()
+            self._states[conversation_id] = state
+        self._states.move_to_end(conversation_id)
+        while len(self._states) > self.max_conversations:
+            self._states.popitem(last=False)
+        return state
+
+    def window(self, conversation_id: Optional[str], messages: List[Dict], client: str = "") -> Dict:
+        """Messages to send upstream (current summary + recent turns); never waits on the summarizer"""
+        conversation_id = conversation_id or derived_conversation_id(messages, client)
+        if conversation_id is None:
+            return {"conversation_id": None, "messages": self._fit(self._budgeted(messages))}
+        state = self._state(conversation_id)
+
+        if state.summarized_count > len(messages):
+            # Client started over (or edited history); rebuild from scratch
+            state.summary = ""
+            state.summarized_count = 0
+            state.generation += 1
+
+        recent = messages[state.summarized_count:]
+        sizes = [message_tokens(m) for m in recent]
+
+        # Fold old turns only once the window overflows, and then fold down to half of it,
+        # so the summarizer runs every few turns rather than on every one. The turn being
+        # answered always stays verbatim, however large it is.
+        if sum(sizes) > self.window_tokens and not state.refreshing:
+            keep_from = latest_user_turn(recent)
+            keep_tokens = sum(sizes[keep_from:])
+            while keep_from > 0 and keep_tokens + sizes[keep_from - 1] <= self.window_tokens // 2:
+                keep_from -= 1
+                keep_tokens += sizes[keep_from]
+            if keep_from > 0:
+                state.refreshing = True
+                task = asyncio.create_task(self._refresh(state, state.generation, recent[:keep_from]))
+                self._refreshes.add(task)
+                task.add_done_callback(self._refreshes.discard)
+
+        state.updated_at = time.time()
+        upstream = []
+        if state.summary:
+            upstream.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation with this user: {state.summary}"
+            })
+        # Until the refresh lands, turns that don't fit are simply left out of this request
+        upstream.extend(self._fit(self._budgeted(recent)))
+        return {"conversation_id": conversation_id, "messages": upstream}
+
+    async def _refresh(self, state: ConversationState, generation: int, evicted: List[Dict]):
+        """Fold `evicted` into the summary in the background; later turns pick it up"""
+        try:
+            summary = await self.summarize(state.summary, evicted)
+            self.summaries_built += 1
+        except asyncio.CancelledError:
+            state.refreshing = False
+            raise
+        except Exception as e:
+            self.summaries_failed += 1
+            logger.warning("conversation summary failed, dropping oldest turns", extra={"error": str(e)})
+            summary = state.summary
+        if state.generation == generation:
+            state.summary = summary
+            state.summarized_count += len(evicted)
+        state.refreshing = False
+
+    def _budgeted(self, recent: List[Dict]) -> List[Dict]:
+        """The newest turns that fit the window, always including the turn being answered"""
+        keep_from = latest_user_turn(recent)
+        if keep_from < 0:
+            return []
+        budget = self.window_tokens - sum(message_tokens(m) for m in recent[keep_from:])
+        while keep_from > 0 and message_tokens(recent[keep_from - 1]) <= budget:
+            keep_from -= 1
+            budget -= message_tokens(recent[keep_from])
+        return recent[keep_from:]
+
+    def _fit(self, recent: List[Dict]) -> List[Dict]:
+        """Cut a single turn that is larger than the whole window down to it (a pasted wall of text)"""
+        budget = self.window_tokens - MESSAGE_OVERHEAD_TOKENS
+        fitted = []
+        for message in recent:
+            if message_tokens(message) > self.window_tokens:
+                self.truncated += 1
+                message = {**message, "content": truncate_tokens(message["content"], budget)}
+            fitted.append(message)
+        return fitted
+
+    async def stop(self):
+        for task in list(self._refreshes):
+            task.cancel()
+        await asyncio.gather(*self._refreshes, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "conversations": len(self._states),
+            "window_tokens": self.window_tokens,
+            "summaries_built": self.summaries_built,
+            "summaries_failed": self.summaries_failed,
+            "summaries_running": len(self._refreshes),
+            "truncated": self.truncated,
+        }
@@ -0,0 +1,116 @@
+# health.py
+"""Background dependency probes; health endpoints read the latest results instead of calling upstreams"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from logs import get_logger
+from metrics import DEPENDENCY_UP
+
+logger = get_logger("health")
+
+OK = "ok"
+ERROR = "error"
+UNKNOWN = "unknown"
+
+
+@dataclass
+class Probe:
+    name: str
+    check: Callable[[], Awaitable[Any]]
+    interval_seconds: float
+    timeout_seconds: float
+    # Readiness requires every critical probe to be passing
+    critical: bool = True
+    status: str = UNKNOWN
+    latency_ms: Optional[float] = None
+    checked_at: Optional[float] = None
+    last_ok_at: Optional[float] = None
+    last_error: Optional[str] = None
+    consecutive_failures: int = 0
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def stale(self) -> bool:
+        """No result for three intervals: the probe itself is stuck"""
+        return self.checked_at is None or time.time() - self.checked_at > 3 * self.interval_seconds
+
+    def snapshot(self) -> Dict:
+        return {
+            "status": UNKNOWN if self.stale and self.checked_at is not None else self.status,
+            "critical": self.critical,
+            "latency_ms": self.latency_ms,
+            "checked_at": self.checked_at,
+            "last_ok_at": self.last_ok_at,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class HealthProber:
+    """Runs each registered check on its own interval and keeps the latest outcome in memory"""
+
+    def __init__(self):
+        self._probes: Dict[str, Probe] = {}
+
+    def register(
+        self,
+        name: str,
+        check: Callable[[], Awaitable[Any]],
+        interval_seconds: float,
+        timeout_seconds: float = 5.0,
+        critical: bool = True
+    ):
+        self._probes[name] = Probe(name, check, interval_seconds, timeout_seconds, critical)
+
+    async def probe(self, probe: Probe):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe.check(), timeout=probe.timeout_seconds)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if probe.status != ERROR:
+                logger.warning("dependency check failed", extra={"dependency": probe.name, "error": error})
+            probe.status = ERROR
+            probe.last_error = error
+            probe.consecutive_failures += 1
+        else:
+            if probe.status == ERROR:
+                logger.info("dependency recovered", extra={"dependency": probe.name})
+            probe.status = OK
+            probe.last_ok_at = time.time()
+            probe.consecutive_failures = 0
+        probe.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        probe.checked_at = time.time()
+        DEPENDENCY_UP.labels(dependency=probe.name).set(1 if probe.status == OK else 0)
+
+    async def _loop(self, probe: Probe):
+        while True:
+            await self.probe(probe)
+            await asyncio.sleep(probe.interval_seconds)
+
+    async def start(self):
+        for probe in self._probes.values():
+            if probe.task is None:
+                probe.task = asyncio.create_task(self._loop(probe))
+
+    async def stop(self):
+        tasks = [p.task for p in self._probes.values() if p.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for probe in self._probes.values():
+            probe.task = None
+
+    def failing(self, critical_only: bool = False) -> List[str]:
+        return [
+            name for name, probe in self._probes.items()
+            if (probe.critical or not critical_only) and (probe.status != OK or probe.stale)
+        ]
+
+    def ready(self) -> bool:
+        return not self.failing(critical_only=True)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: probe.snapshot() for name, probe in self._probes.items()}
@@ -0,0 +1,165 @@
+# http_cache.py
+"""Conditional GETs for read endpoints: strong ETags, 304s, Cache-Control and pre-compressed JSON bodies"""
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Smaller bodies cost more to compress than they save on the wire
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1000"))
+# Serialized + compressed bodies kept per (ETag, encoding) so repeat reads skip both steps
+HTTP_CACHE_BODIES = int(os.getenv("HTTP_CACHE_BODIES", "1024"))
+HTTP_CACHE_MAX_BODY_BYTES = int(os.getenv("HTTP_CACHE_MAX_BODY_BYTES", str(256 * 1024)))
+
+# Never changes between deploys
+STATIC = "public, max-age=86400"
+# Per-user data that can change (completion, feedback): the client keeps it but revalidates every time
+PRIVATE_REVALIDATE = "private, no-cache"
+
+if importlib.util.find_spec("brotli") is not None:
+    import brotli
+else:
+    brotli = None
+
+# ETag suffix per content coding: each encoded representation gets its own strong validator
+ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gz", "identity": ""}
+
+
+def version_tag(*parts: Any) -> str:
+    """Strong ETag from whatever identifies a version of the resource (ids, mutable columns)"""
+    raw = json.dumps(parts, default=str, separators=(",", ":"), sort_keys=True)
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=16).hexdigest() + '"'
+
+
+def without_exercises(row: Dict) -> Dict:
+    """A workout's version: exercises are written once at insert, so they're left out of the hash"""
+    return {k: v for k, v in row.items() if k != "exercises"}
+
+
+def _base(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_SUFFIXES.values():
+        if suffix and tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match uses weak comparison, and any encoding of the same version counts"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _base(etag) in {_base(tag) for tag in header.split(",")}
+
+
+def negotiate(request: Request) -> str:
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("accept-encoding", "").split(",")
+        if not part.strip().endswith(";q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def encode_json(content: Any) -> bytes:
+    # Same wire format as FastAPI's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+class HTTPCache:
+    """Builds cacheable JSON responses and remembers their encoded bodies"""
+
+    def __init__(
+        self,
+        max_bodies: int = HTTP_CACHE_BODIES,
+        max_body_bytes: int = HTTP_CACHE_MAX_BODY_BYTES,
+        compress_min_bytes: int = HTTP_COMPRESS_MIN_BYTES
+    ):
+        self.max_bodies = max_bodies
+        self.max_body_bytes = max_body_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self._bodies: "OrderedDict[Tuple[str, str], Tuple[bytes, str]]" = OrderedDict()
+
+        self.not_modified = 0
+        self.body_hits = 0
+        self.body_misses = 0
+        self.bytes_saved = 0
+
+    def _headers(self, etag: str, cache_control: str, encoding: str = "identity") -> Dict[str, str]:
+        headers = {
+            "ETag": etag[:-1] + ENCODING_SUFFIXES[encoding] + '"',
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding"
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return headers
+
+    def _encoded(self, etag: str, encoding: str, build: Callable[[], Any]) -> Tuple[bytes, str]:
+        key = (etag, encoding)
+        cached = self._bodies.get(key)
+        if cached is not None:
+            self._bodies.move_to_end(key)
+            self.body_hits += 1
+            return cached
+
+        self.body_misses += 1
+        body = build()
+        if not isinstance(body, bytes):
+            body = encode_json(body)
+        used = encoding if len(body) >= self.compress_min_bytes else "identity"
+        encoded = compress(body, used)
+        self.bytes_saved += len(body) - len(encoded)
+        if len(encoded) <= self.max_body_bytes:
+            self._bodies[key] = (encoded, used)
+            while len(self._bodies) > self.max_bodies:
+                self._bodies.popitem(last=False)
+        return encoded, used
+
+    def respond(self, request: Request, etag: str, cache_control: str, build: Callable[[], Any]) -> Response:
+        """304 when the client already has this version; otherwise the (cached) encoded body"""
+        if not_modified(request, etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=self._headers(etag, cache_control))
+        body, encoding = self._encoded(etag, negotiate(request), build)
+        return Response(body, media_type="application/json", headers=self._headers(etag, cache_control, encoding))
+
+    def json(self, request: Request, content: Any, cache_control: str) -> Response:
+        """For content without a cheap version: the ETag is a hash of the serialized body"""
+        body = encode_json(content)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        return self.respond(request, etag, cache_control, lambda: body)
+
+    def stats(self) -> Dict:
+        return {
+            "bodies": len(self._bodies),
+            "max_bodies": self.max_bodies,
+            "not_modified": self.not_modified,
+            "body_hits": self.body_hits,
+            "body_misses": self.body_misses,
+            "bytes_saved": self.bytes_saved,
+            "brotli": brotli is not None,
+        }
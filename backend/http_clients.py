@@ -0,0 +1,174 @@
+# http_clients.py
+"""Application-lifetime pooled HTTP clients, one per upstream host"""
+import asyncio
+import importlib.util
+import os
+import random
+import ssl
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+
+from metrics import UPSTREAM_DURATION, record_upstream_error
+
+HTTP2_ENABLED = (
+    os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+RETRY_STATUSES = {429, 502, 503, 504}
+RETRY_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def shared_ssl_context() -> ssl.SSLContext:
+    """One CA bundle load (~30ms) for every client in the process, and its pre-forked workers"""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def preload():
+    """Load the CA bundle and import the transport stack httpx pulls in lazily on its first client"""
+    httpx.AsyncHTTPTransport(http2=HTTP2_ENABLED, verify=shared_ssl_context())
+
+
+@dataclass
+class HostConfig:
+    """Tuning for one upstream host"""
+    base_url: str
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    retries: int = 2
+    backoff_seconds: float = 0.25
+    # Replaces the network transport, e.g. with a local fake for benchmarks
+    transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """Retries idempotent requests on connection errors and 429/5xx with jittered exponential backoff"""
+
+    def __init__(self, name: str, inner: httpx.AsyncBaseTransport, retries: int, backoff_seconds: float):
+        self.name = name
+        self.inner = inner
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.in_flight = 0
+        self.retried = 0
+
+    async def _backoff(self, attempt: int):
+        self.retried += 1
+        delay = self.backoff_seconds * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        retryable = request.method in RETRY_METHODS
+        attempt = 0
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    response = await self.inner.handle_async_request(request)
+                except httpx.TransportError as e:
+                    record_upstream_error(self.name, e)
+                    if not retryable or attempt >= self.retries:
+                        raise
+                    await self._backoff(attempt)
+                    attempt += 1
+                    continue
+
+                if response.status_code >= 500 or response.status_code == 429:
+                    record_upstream_error(self.name, reason=f"http_{response.status_code}")
+                if retryable and response.status_code in RETRY_STATUSES and attempt < self.retries:
+                    await response.aclose()
+                    await self._backoff(attempt)
+                    attempt += 1
+                    continue
+                return response
+        finally:
+            self.in_flight -= 1
+            UPSTREAM_DURATION.labels(upstream=self.name).observe(time.perf_counter() - started)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ClientRegistry:
+    """Creates tuned clients once at startup and closes them at shutdown"""
+
+    def __init__(self):
+        self._configs: Dict[str, HostConfig] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, RetryTransport] = {}
+
+    def register(self, name: str, config: HostConfig):
+        self._configs[name] = config
+
+    def config(self, name: str) -> HostConfig:
+        return self._configs[name]
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        config = self._configs[name]
+        limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry
+        )
+        transport = RetryTransport(
+            name,
+            config.transport or httpx.AsyncHTTPTransport(
+                http2=HTTP2_ENABLED,
+                limits=limits,
+                verify=shared_ssl_context()
+            ),
+            retries=config.retries,
+            backoff_seconds=config.backoff_seconds
+        )
+        self._transports[name] = transport
+        return httpx.AsyncClient(
+            base_url=config.base_url,
+            transport=transport,
+            timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout)
+        )
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        """Shared client for a registered host (built on first use if startup hasn't run)"""
+        if name not in self._clients:
+            if name not in self._configs:
+                raise KeyError(f"No HTTP client registered for '{name}'")
+            self._clients[name] = self._build(name)
+        return self._clients[name]
+
+    async def start(self):
+        for name in self._configs:
+            self.client(name)
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self._transports.clear()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Open/idle/waiting counts per pool"""
+        stats = {}
+        for name, transport in self._transports.items():
+            pool = getattr(transport.inner, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            requests = list(getattr(pool, "_requests", []))
+            stats[name] = {
+                "http2": HTTP2_ENABLED,
+                "open": sum(1 for c in connections if not c.is_closed()),
+                "idle": sum(1 for c in connections if c.is_idle()),
+                "waiting": sum(1 for r in requests if r.is_queued()),
+                "in_flight": transport.in_flight,
+                "retried": transport.retried,
+            }
+        return stats
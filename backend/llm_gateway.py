@@ -0,0 +1,398 @@
+# llm_gateway.py
+"""Single entry point for LLM calls: concurrency caps, deadlines, priorities, hedging, circuit breaking"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, Optional
+
+from metrics import LLM_TOKENS, UPSTREAM_DURATION, record_upstream_error
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = 200
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    STANDARD = 1
+    BACKGROUND = 2
+
+
+class LLMUnavailable(Exception):
+    """The route's circuit is open; callers should use their local fallback"""
+
+
+@dataclass
+class RouteConfig:
+    """Limits for one kind of LLM call"""
+    concurrency: int = 8
+    deadline_seconds: float = 30.0
+    priority: Priority = Priority.STANDARD
+    hedge: bool = False
+    failure_threshold: int = 5
+    reset_seconds: float = 30.0
+    # A stream that goes this long without a chunk is abandoned and its slot released
+    stream_idle_seconds: float = 30.0
+
+
+class PrioritySemaphore:
+    """Semaphore that hands freed slots to the highest-priority waiter first (FIFO within a priority)"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._available = capacity
+        self._waiters: list = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    @property
+    def in_use(self) -> int:
+        return self.capacity - self._available
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now and nobody is queued for it"""
+        if self._available > 0 and not self.waiting:
+            self._available -= 1
+            return True
+        return False
+
+    async def acquire(self, priority: Priority):
+        if self._available > 0 and not self.waiting:
+            self._available -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as we were cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._available += 1
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, lets one trial call through after a cool-down"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def abandon(self):
+        """A trial call was cancelled before it could prove anything"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RouteState:
+    def __init__(self, config: RouteConfig):
+        self.config = config
+        self.semaphore = asyncio.Semaphore(config.concurrency)
+        self.breaker = CircuitBreaker(config.failure_threshold, config.reset_seconds)
+        # Completed calls only: hedging compares a call in flight against these
+        self.latencies: Deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+        # Time until a stream opened; much shorter than a full completion, so kept apart
+        self.stream_latencies: Deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedges_skipped = 0
+        self.rejected = 0
+
+    def p95(self, latencies: Optional[Deque[float]] = None) -> Optional[float]:
+        latencies = self.latencies if latencies is None else latencies
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def record_tokens(route: str, usage: Any):
+    LLM_TOKENS.labels(route=route, kind="prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(route=route, kind="completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+class GatewayStream:
+    """A streaming completion that holds its concurrency slot until closed, ends or stalls"""
+
+    def __init__(
+        self,
+        stream,
+        release: Callable[[], None],
+        on_usage: Callable[[Any], None],
+        on_stall: Callable[[], None],
+        idle_seconds: float
+    ):
+        self._stream = stream
+        self._release = release
+        self._on_usage = on_usage
+        self._on_stall = on_stall
+        self._idle_seconds = idle_seconds
+        self._closed = False
+
+    async def __aiter__(self):
+        chunks = self._stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self._idle_seconds)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self._on_stall()
+                    raise
+                # Only present when the provider reports usage on streams (usually the final chunk)
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    self._on_usage(usage)
+                yield chunk
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+
+class LLMGateway:
+    def __init__(self, client=None, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.client = client
+        self.slots = PrioritySemaphore(max_concurrency)
+        self._routes: Dict[str, RouteState] = {}
+
+    def register(self, route: str, config: RouteConfig):
+        self._routes[route] = RouteState(config)
+
+    def divide(self, processes: int):
+        """Split every cap between `processes` copies of this gateway calling the same provider"""
+        self.slots = PrioritySemaphore(max(1, self.slots.capacity // processes))
+        for state in self._routes.values():
+            state.config.concurrency = max(1, state.config.concurrency // processes)
+            state.semaphore = asyncio.Semaphore(state.config.concurrency)
+
+    def _route(self, route: str) -> RouteState:
+        state = self._routes[route]
+        if self.client is None:
+            raise LLMUnavailable("LLM client is not configured")
+        if not state.breaker.allow():
+            state.rejected += 1
+            record_upstream_error("llm", reason="circuit_open")
+            raise LLMUnavailable(f"LLM circuit open for '{route}'")
+        return state
+
+    async def _acquire(self, state: RouteState):
+        await state.semaphore.acquire()
+        try:
+            await self.slots.acquire(state.config.priority)
+        except BaseException:
+            state.semaphore.release()
+            raise
+
+    async def _try_acquire(self, state: RouteState) -> bool:
+        """A slot for a hedge, without waiting: a hedge that has to queue is no faster than the primary"""
+        if state.semaphore.locked() or not self.slots.try_acquire():
+            return False
+        # Not locked, so this returns without suspending
+        await state.semaphore.acquire()
+        return True
+
+    def _release(self, state: RouteState):
+        self.slots.release()
+        state.semaphore.release()
+
+    async def _hedged(self, state: RouteState, kwargs: Dict) -> Any:
+        """Send the call; if it outlives the route's p95, race a duplicate and keep whichever lands first"""
+        primary = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+        threshold = state.p95() if (state.config.hedge and LLM_HEDGE_ENABLED) else None
+        if threshold is None:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=threshold)
+            if not done:
+                if await self._try_acquire(state):
+                    state.hedged += 1
+                    hedge = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+                    # Held until the hedge finishes or is cancelled, like the primary's slot
+                    hedge.add_done_callback(lambda _: self._release(state))
+                    pending.add(hedge)
+                else:
+                    state.hedges_skipped += 1
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, route: str, **kwargs) -> Any:
+        """chat.completions.create under the route's limits; raises LLMUnavailable or asyncio.TimeoutError"""
+        state = self._route(route)
+        state.calls += 1
+        started = time.monotonic()
+        # Latency is measured from getting a slot: queueing under load says nothing about
+        # how long the provider takes, and would push the hedge threshold up when it matters
+        acquired = [started]
+        try:
+            async def call():
+                await self._acquire(state)
+                acquired[0] = time.monotonic()
+                try:
+                    return await self._hedged(state, kwargs)
+                finally:
+                    self._release(state)
+
+            response = await asyncio.wait_for(call(), timeout=state.config.deadline_seconds)
+        except asyncio.TimeoutError:
+            state.timeouts += 1
+            state.breaker.record_failure()
+            record_upstream_error("llm", reason="timeout")
+            raise
+        except asyncio.CancelledError:
+            state.breaker.abandon()
+            raise
+        except Exception as e:
+            state.errors += 1
+            state.breaker.record_failure()
+            record_upstream_error("llm", e)
+            raise
+
+        state.breaker.record_success()
+        state.latencies.append(time.monotonic() - acquired[0])
+        UPSTREAM_DURATION.labels(upstream="llm").observe(time.monotonic() - started)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_tokens(route, usage)
+        return response
+
+    async def stream(self, route: str, **kwargs) -> GatewayStream:
+        """Open a streaming completion; the deadline covers getting the stream started"""
+        state = self._route(route)
+        state.calls += 1
+        started = time.monotonic()
+        acquired = [started]
+
+        async def open_stream():
+            await self._acquire(state)
+            acquired[0] = time.monotonic()
+            try:
+                return await self.client.chat.completions.create(stream=True, **kwargs)
+            except BaseException:
+                self._release(state)
+                raise
+
+        try:
+            stream = await asyncio.wait_for(open_stream(), timeout=state.config.deadline_seconds)
+        except asyncio.TimeoutError:
+            state.timeouts += 1
+            state.breaker.record_failure()
+            record_upstream_error("llm", reason="timeout")
+            raise
+        except asyncio.CancelledError:
+            state.breaker.abandon()
+            raise
+        except Exception as e:
+            state.errors += 1
+            state.breaker.record_failure()
+            record_upstream_error("llm", e)
+            raise
+
+        state.breaker.record_success()
+        state.stream_latencies.append(time.monotonic() - acquired[0])
+
+        def stalled():
+            state.timeouts += 1
+            record_upstream_error("llm", reason="stream_idle")
+
+        return GatewayStream(
+            stream,
+            lambda: self._release(state),
+            lambda usage: record_tokens(route, usage),
+            stalled,
+            state.config.stream_idle_seconds
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "in_use": self.slots.in_use,
+            "waiting": self.slots.waiting,
+            "capacity": self.slots.capacity,
+            "routes": {
+                name: {
+                    "priority": state.config.priority.name.lower(),
+                    "circuit": state.breaker.state,
+                    "calls": state.calls,
+                    "errors": state.errors,
+                    "timeouts": state.timeouts,
+                    "hedged": state.hedged,
+                    "hedges_skipped": state.hedges_skipped,
+                    "rejected": state.rejected,
+                    "p95_seconds": round(state.p95(), 3) if state.p95() is not None else None,
+                    "stream_open_p95_seconds": (
+                        round(state.p95(state.stream_latencies), 3)
+                        if state.p95(state.stream_latencies) is not None else None
+                    ),
+                }
+                for name, state in self._routes.items()
+            }
+        }
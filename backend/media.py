@@ -0,0 +1,103 @@
+# media.py
+"""Concurrent image/video enrichment for generated workouts"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from http_clients import ClientRegistry
+
+MEDIA_MAX_CONCURRENCY = int(os.getenv("WGER_MEDIA_MAX_CONCURRENCY", "8"))
+MEDIA_CACHE_SIZE = int(os.getenv("WGER_MEDIA_CACHE_SIZE", "2048"))
+MEDIA_CACHE_TTL_SECONDS = int(os.getenv("WGER_MEDIA_CACHE_TTL_SECONDS", str(6 * 3600)))
+
+
+class MediaCache:
+    """LRU cache of {images, videos} per exercise id, entries expire after a TTL"""
+
+    def __init__(self, max_size: int = MEDIA_CACHE_SIZE, ttl_seconds: int = MEDIA_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, exercise_id: int) -> Optional[Dict]:
+        entry = self._entries.get(exercise_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[exercise_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(exercise_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, exercise_id: int, media: Dict):
+        self._entries[exercise_id] = (time.monotonic(), media)
+        self._entries.move_to_end(exercise_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class MediaEnricher:
+    """Fans out image/video lookups over the shared Wger pool, bounded by a semaphore"""
+
+    def __init__(
+        self,
+        http: ClientRegistry,
+        catalog=None,
+        max_concurrency: int = MEDIA_MAX_CONCURRENCY,
+        cache: Optional[MediaCache] = None
+    ):
+        self.http = http
+        self.catalog = catalog
+        self.cache = cache or MediaCache()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _fetch(self, endpoint: str, exercise_id: int, field: str) -> List[str]:
+        async with self._semaphore:
+            response = await self.http.client("wger").get(
+                f"/{endpoint}/",
+                params={"exercise": exercise_id}
+            )
+        response.raise_for_status()
+        return [item.get(field) for item in response.json().get("results", [])]
+
+    async def media_for(self, exercise_id: int) -> Dict:
+        """Images and videos for one exercise: cache, then catalog, then Wger"""
+        cached = self.cache.get(exercise_id)
+        if cached is not None:
+            return cached
+
+        cataloged = self.catalog.get(exercise_id) if self.catalog else None
+        if cataloged:
+            media = {"images": cataloged["images"], "videos": cataloged["videos"]}
+            self.cache.put(exercise_id, media)
+            return media
+
+        images, videos = await asyncio.gather(
+            self._fetch("exerciseimage", exercise_id, "image"),
+            self._fetch("exercisevideo", exercise_id, "video"),
+            return_exceptions=True
+        )
+        media = {
+            "images": images if isinstance(images, list) else [],
+            "videos": videos if isinstance(videos, list) else [],
+        }
+        # Don't pin an empty result caused by a transient upstream failure
+        if not isinstance(images, BaseException) and not isinstance(videos, BaseException):
+            self.cache.put(exercise_id, media)
+        return media
+
+    async def enrich(self, exercises: List[Dict]) -> List[Dict]:
+        """Attach images/videos to every exercise in one concurrent pass"""
+        results = await asyncio.gather(*(self.media_for(ex["id"]) for ex in exercises))
+        for exercise, media in zip(exercises, results):
+            exercise["images"] = media["images"]
+            exercise["videos"] = media["videos"]
+        return exercises
@@ -0,0 +1,223 @@
+# metrics.py
+"""In-process counters and histograms, per-stage spans and request middleware, rendered as Prometheus text"""
+import bisect
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from logs import get_logger, request_id_var
+
+logger = get_logger("http")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = float(value)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        """Shortcut for metrics without labels"""
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_label_str(self.labelnames, key)} {child.value}"
+            for key, child in sorted(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _Buckets:
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                le = _label_str(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _label_str(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {child.count}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {child.sum}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {child.count}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+HTTP_REQUESTS = Counter("swole_http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_DURATION = Histogram("swole_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("swole_http_requests_in_flight", "HTTP requests currently being handled")
+STAGE_DURATION = Histogram("swole_stage_duration_seconds", "Time spent in each request stage", ("stage", "outcome"))
+UPSTREAM_DURATION = Histogram("swole_upstream_duration_seconds", "Latency of calls to upstream services", ("upstream",))
+UPSTREAM_ERRORS = Counter("swole_upstream_errors_total", "Failed calls to upstream services", ("upstream", "reason"))
+LLM_TOKENS = Counter("swole_llm_tokens_total", "LLM tokens consumed", ("route", "kind"))
+DEPENDENCY_UP = Gauge("swole_dependency_up", "Whether the last background probe of a dependency passed", ("dependency",))
+
+
+def render() -> str:
+    """Every registered metric in Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one stage of the current request"""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.labels(stage=stage, outcome=outcome).observe(elapsed)
+        logger.debug("stage finished", extra={"stage": stage, "outcome": outcome, "duration_ms": round(elapsed * 1000, 2)})
+
+
+def record_upstream_error(upstream: str, error: Optional[BaseException] = None, reason: Optional[str] = None):
+    UPSTREAM_ERRORS.labels(upstream=upstream, reason=reason or type(error).__name__).inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request id, per-route latency/status metrics and one access log line per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            # Label by the route template, not the raw path, to keep cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method=method, route=route, status=status["code"]).inc()
+            HTTP_DURATION.labels(method=method, route=route).observe(elapsed)
+            logger.info("request", extra={
+                "method": method,
+                "route": route,
+                "status": status["code"],
+                "duration_ms": round(elapsed * 1000, 2)
+            })
+            request_id_var.reset(token)
@@ -0,0 +1,3 @@
+-- Feedback recommendations (rule-based at once, replaced by the AI one when it lands)
+-- are stored on the workout row. Run once in the Supabase SQL editor.
+ALTER TABLE workouts ADD COLUMN IF NOT EXISTS recommendation text;
@@ -0,0 +1,192 @@
+# plan_cache.py
+"""Cache of generated workout plans keyed on a normalized profile + request fingerprint"""
+import copy
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+PLAN_CACHE_BACKEND = os.getenv("PLAN_CACHE_BACKEND", "memory")
+PLAN_CACHE_DIR = os.getenv(
+    "PLAN_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "plan_cache")
+)
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "5000"))
+PLAN_CACHE_TTL_SECONDS = int(os.getenv("PLAN_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# How many distinct plans to collect per fingerprint before serving from cache
+PLAN_CACHE_VARIANTS = int(os.getenv("PLAN_CACHE_VARIANTS", "3"))
+
+AGE_BANDS = [(17, "teen"), (29, "18-29"), (44, "30-44"), (59, "45-59")]
+
+
+def age_band(age: int) -> str:
+    for upper, label in AGE_BANDS:
+        if age <= upper:
+            return label
+    return "60+"
+
+
+def _normalized(values: Optional[List[str]]) -> List[str]:
+    return sorted({v.strip().lower() for v in values or [] if v and v.strip()})
+
+
+def plan_fingerprint(
+    profile: Dict,
+    workout_type: str,
+    duration_minutes: int,
+    equipment: Optional[List[str]] = None
+) -> str:
+    """Stable hash of everything that shapes a plan (but nothing user-identifying)"""
+    shape = {
+        "fitness_level": profile["fitness_level"],
+        "goals": _normalized(profile.get("goals")),
+        "medical_conditions": _normalized(profile.get("medical_conditions")),
+        "age_band": age_band(profile["age"]),
+        "workout_type": workout_type,
+        "duration_minutes": duration_minutes,
+        "equipment": _normalized(equipment),
+    }
+    encoded = json.dumps(shape, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+# ---------- backends ----------
+class MemoryBackend:
+    """In-process LRU"""
+
+    def __init__(self, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: Dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskBackend:
+    """One JSON file per fingerprint; LRU order is rebuilt from file mtimes on startup"""
+
+    def __init__(self, directory: str = PLAN_CACHE_DIR, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        files = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        self._order: "OrderedDict[str, None]" = OrderedDict((f.name[:-5], None) for f in files)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        if key not in self._order:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._order.pop(key, None)
+            return None
+        self._order.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: Dict):
+        tmp_path = f"{self._path(key)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+        self._order[key] = None
+        self._order.move_to_end(key)
+        while len(self._order) > self.max_entries:
+            self.delete(next(iter(self._order)))
+
+    def delete(self, key: str):
+        self._order.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+def make_backend(name: str = PLAN_CACHE_BACKEND):
+    if name == "disk":
+        return DiskBackend()
+    return MemoryBackend()
+
+
+# ---------- cache ----------
+class PlanCache:
+    """TTL + LRU plan cache that serves a random variant once enough have been collected"""
+
+    def __init__(
+        self,
+        backend=None,
+        ttl_seconds: int = PLAN_CACHE_TTL_SECONDS,
+        variants: int = PLAN_CACHE_VARIANTS
+    ):
+        self.backend = backend if backend is not None else make_backend()
+        self.ttl_seconds = ttl_seconds
+        self.variants = max(1, variants)
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh_variants(self, key: str) -> List[Dict]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return []
+        now = time.time()
+        fresh = [v for v in entry["variants"] if now - v["cached_at"] < self.ttl_seconds]
+        if len(fresh) != len(entry["variants"]):
+            if fresh:
+                self.backend.set(key, {"variants": fresh})
+            else:
+                self.backend.delete(key)
+        return fresh
+
+    def get(self, key: str) -> Optional[Dict]:
+        """A cached plan, or None if the fingerprint still needs more variety (or has none)"""
+        fresh = self._fresh_variants(key)
+        if len(fresh) < self.variants:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.deepcopy(random.choice(fresh)["plan"])
+
+    def put(self, key: str, plan: Dict):
+        fresh = self._fresh_variants(key)
+        fresh.append({"cached_at": time.time(), "plan": copy.deepcopy(plan)})
+        # Oldest variants rotate out so the pool keeps evolving
+        self.backend.set(key, {"variants": fresh[-self.variants:]})
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "variants_per_key": self.variants,
+            "ttl_seconds": self.ttl_seconds,
+        }
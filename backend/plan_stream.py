@@ -0,0 +1,77 @@
+# plan_stream.py
+"""Incremental parsing of a streamed workout plan: each exercise is usable as soon as its object closes"""
+import json
+from typing import Dict, List, Optional
+
+
+def strip_fences(text: str) -> str:
+    """Drop the ``` / ```json markdown fences models like to wrap JSON in"""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text.replace("```json", "").replace("```", "").strip()
+    if text.startswith("```"):
+        text = text.replace("```", "").strip()
+    return text
+
+
+class ExerciseStreamParser:
+    """Feed LLM output chunks; get back the objects of the top-level "exercises" array as they complete"""
+
+    def __init__(self):
+        self.text = ""
+        self.exercises: List[Dict] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_root_string: Optional[str] = None
+        self._in_exercises = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Exercises completed by this chunk, in order"""
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_root_string = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._last_root_string == "exercises":
+                    self._in_exercises = True
+                elif ch == "{" and self._in_exercises and self._depth == 2:
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._in_exercises and self._depth == 2 and self._object_start is not None:
+                    try:
+                        exercise = json.loads(text[self._object_start:i + 1])
+                    except json.JSONDecodeError:
+                        exercise = None
+                    if isinstance(exercise, dict):
+                        self.exercises.append(exercise)
+                        completed.append(exercise)
+                    self._object_start = None
+                elif ch == "]" and self._in_exercises and self._depth == 1:
+                    self._in_exercises = False
+        self._pos = len(text)
+        return completed
+
+    def plan(self) -> Dict:
+        """The whole plan once the stream has ended; raises ValueError if it isn't valid JSON"""
+        return json.loads(strip_fences(self.text))
@@ -0,0 +1,194 @@
+# planner.py
+"""Deterministic rule-based workout planner over the exercise catalog (no LLM)"""
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+BODYWEIGHT = "none (bodyweight exercise)"
+
+VOLUME = {
+    "beginner": {"sets": 2, "reps": 10, "rest_seconds": 75, "max_sets": 3},
+    "intermediate": {"sets": 3, "reps": 10, "rest_seconds": 60, "max_sets": 4},
+    "advanced": {"sets": 4, "reps": 8, "rest_seconds": 45, "max_sets": 5},
+}
+SECONDS_PER_SET = 45
+TRANSITION_SECONDS = 60
+MIN_EXERCISES = 3
+MAX_EXERCISES = 8
+MIN_REST_SECONDS = 15
+# Memoized (categories, equipment) groupings kept per catalog snapshot
+PLANNER_MAX_GROUPINGS = int(os.getenv("PLANNER_MAX_GROUPINGS", "256"))
+
+# Rough metabolic equivalents for calorie estimates
+MET = {"cardio": 7.0, "stretching": 2.5}
+DEFAULT_MET = 5.0
+
+CUES_BY_CATEGORY = {
+    "Abs": ["Brace your core", "Keep your lower back neutral", "Exhale on the effort"],
+    "Arms": ["Keep elbows still", "Control the lowering phase", "Squeeze at the top"],
+    "Back": ["Lead with your elbows", "Squeeze shoulder blades together", "Keep your chest proud"],
+    "Calves": ["Pause at the top", "Use the full range of motion", "Don't bounce"],
+    "Cardio": ["Keep a steady rhythm", "Breathe deeply", "Land softly"],
+    "Chest": ["Keep shoulder blades pinned", "Lower under control", "Press through the full range"],
+    "Legs": ["Drive through your heels", "Keep knees tracking over toes", "Keep your torso upright"],
+    "Shoulders": ["Avoid shrugging", "Keep your core tight", "Press in a controlled arc"],
+}
+DEFAULT_CUES = ["Maintain proper form", "Control breathing", "Start light"]
+
+
+def normalize_name(name: str) -> str:
+    name = name.strip().lower()
+    return name[:-1] if name.endswith("s") and not name.endswith("ss") else name
+
+
+def _primary_group(ex: Dict) -> str:
+    muscles = ex.get("muscles") or []
+    if muscles and muscles[0].get("name"):
+        return muscles[0]["name"]
+    return (ex.get("category") or {}).get("name") or "General"
+
+
+def equipment_ok(ex: Dict, allowed: Optional[frozenset]) -> bool:
+    if allowed is None:
+        return True
+    names = {normalize_name(e.get("name", "")) for e in ex.get("equipment", [])}
+    names.discard(normalize_name(BODYWEIGHT))
+    return names <= allowed
+
+
+def session_seconds(count: int, volume: Dict) -> int:
+    return count * (volume["sets"] * (SECONDS_PER_SET + volume["rest_seconds"]) + TRANSITION_SECONDS)
+
+
+def volume_for(fitness_level: str, duration_minutes: int) -> Tuple[int, Dict]:
+    """Number of exercises and per-exercise volume that fill the session without running over it"""
+    volume = dict(VOLUME.get(fitness_level, VOLUME["beginner"]))
+    budget = duration_minutes * 60
+    count = round(budget / session_seconds(1, volume))
+    count = max(MIN_EXERCISES, min(MAX_EXERCISES, count))
+
+    # Rounding up can overshoot; short sessions keep MIN_EXERCISES with fewer sets, then shorter rests
+    while session_seconds(count, volume) > budget and count > MIN_EXERCISES:
+        count -= 1
+    while session_seconds(count, volume) > budget and volume["sets"] > 1:
+        volume["sets"] -= 1
+    while session_seconds(count, volume) > budget and volume["rest_seconds"] > MIN_REST_SECONDS:
+        volume["rest_seconds"] = max(MIN_REST_SECONDS, volume["rest_seconds"] - 15)
+
+    # Spend leftover time on extra sets rather than extra exercises
+    while volume["sets"] < volume["max_sets"]:
+        longer = dict(volume, sets=volume["sets"] + 1)
+        if session_seconds(count, longer) > budget:
+            break
+        volume["sets"] += 1
+    return count, volume
+
+
+def estimate_calories(workout_type: str, duration_minutes: int, weight_kg: Optional[float]) -> int:
+    met = MET.get(workout_type, DEFAULT_MET)
+    return round(met * 3.5 * (weight_kg or 70) / 200 * duration_minutes)
+
+
+class WorkoutPlanner:
+    """Balances muscle groups, respects equipment and scales volume to level and duration"""
+
+    def __init__(self, catalog, max_groupings: int = PLANNER_MAX_GROUPINGS):
+        self.catalog = catalog
+        self.max_groupings = max_groupings
+        self._groups: "OrderedDict[Tuple, List[Tuple[str, List[Dict]]]]" = OrderedDict()
+        self._groups_version = None
+        self._known_equipment: frozenset = frozenset()
+
+    def _grouped(
+        self,
+        categories: List[int],
+        allowed: Optional[frozenset],
+        exercises: Optional[List[Dict]]
+    ) -> List[Tuple[str, List[Dict]]]:
+        """Candidates grouped by primary muscle, memoized per catalog snapshot"""
+        from_catalog = exercises is None
+        if from_catalog:
+            if self._groups_version != self.catalog.synced_at:
+                self._groups = OrderedDict()
+                self._groups_version = self.catalog.synced_at
+                self._known_equipment = frozenset(normalize_name(name) for name in self.catalog.by_equipment)
+            if allowed is not None:
+                # Names no exercise uses can't change which ones pass, so they stay out of the key
+                allowed = allowed & self._known_equipment
+            key = (tuple(categories), allowed)
+            if key in self._groups:
+                self._groups.move_to_end(key)
+                return self._groups[key]
+            exercises = self.catalog.for_categories(categories, limit=10_000)
+
+        groups: Dict[str, List[Dict]] = {}
+        for ex in exercises:
+            if equipment_ok(ex, allowed):
+                groups.setdefault(_primary_group(ex), []).append(ex)
+
+        # Exercises with demo media first, then by id so output is stable
+        ordered = [
+            (muscle, sorted(members, key=lambda ex: (not ex.get("images"), ex.get("id"))))
+            for muscle, members in sorted(groups.items(), key=lambda g: (-len(g[1]), g[0]))
+        ]
+        if from_catalog:
+            self._groups[key] = ordered
+            while len(self._groups) > self.max_groupings:
+                self._groups.popitem(last=False)
+        return ordered
+
+    def plan(
+        self,
+        profile: Dict,
+        workout_type: str,
+        categories: List[int],
+        duration_minutes: int,
+        equipment_available: Optional[List[str]] = None,
+        exercises: Optional[List[Dict]] = None
+    ) -> Dict:
+        """Build a plan in the same shape the LLM returns"""
+        allowed = None
+        if equipment_available:
+            allowed = frozenset(normalize_name(e) for e in equipment_available)
+
+        groups = self._grouped(categories, allowed, exercises)
+        if not groups and allowed is not None:
+            # Nothing matches the listed equipment; a plan beats an empty response
+            groups = self._grouped(categories, None, exercises)
+        count, volume = volume_for(profile["fitness_level"], duration_minutes)
+
+        # Round-robin across muscle groups so no group gets a second exercise before all have one
+        selected: List[Dict] = []
+        depth = 0
+        while len(selected) < count and any(depth < len(members) for _, members in groups):
+            for _, members in groups:
+                if depth < len(members) and len(selected) < count:
+                    selected.append(members[depth])
+            depth += 1
+
+        # Compound movements while fresh, isolation work after
+        selected.sort(key=lambda ex: -len(ex.get("muscles", [])) - len(ex.get("muscles_secondary", [])))
+
+        return {
+            "exercises": [
+                {
+                    "id": ex.get("id"),
+                    "name": ex.get("name"),
+                    "sets": volume["sets"],
+                    "reps": volume["reps"],
+                    "rest_seconds": volume["rest_seconds"],
+                    "coaching_cues": list(CUES_BY_CATEGORY.get(
+                        (ex.get("category") or {}).get("name"), DEFAULT_CUES
+                    )),
+                    "why_chosen": f"Targets {_primary_group(ex).lower()}",
+                    "images": ex.get("images", []),
+                    "videos": ex.get("videos", []),
+                    "muscles": [m.get("name") for m in ex.get("muscles", [])],
+                    "equipment": [e.get("name") for e in ex.get("equipment", [])],
+                    "description": ex.get("description", "")
+                }
+                for ex in selected
+            ],
+            "estimated_calories": estimate_calories(workout_type, duration_minutes, profile.get("weight_kg")),
+            "workout_notes": "Great workout ahead!"
+        }
@@ -0,0 +1,236 @@
+# pregen.py
+"""Speculative pre-generation of a user's next workout once they finish one"""
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from logs import get_logger
+
+logger = get_logger("pregen")
+
+PREGEN_ENABLED = os.getenv("PREGEN_ENABLED", "true").lower() == "true"
+PREGEN_CONCURRENCY = int(os.getenv("PREGEN_CONCURRENCY", "2"))
+# Upper bound on speculative LLM generations per rolling hour, across all users
+PREGEN_MAX_PER_HOUR = int(os.getenv("PREGEN_MAX_PER_HOUR", "60"))
+PREGEN_TTL_SECONDS = int(os.getenv("PREGEN_TTL_SECONDS", str(12 * 3600)))
+PREGEN_MAX_USERS = int(os.getenv("PREGEN_MAX_USERS", "10000"))
+PREGEN_QUEUE_SIZE = 1000
+
+HARD_RATING = 8
+EASY_RATING = 3
+DURATION_STEPS = (15, 20, 30, 45, 60, 75, 90)
+
+# Used until a user's own history shows what they do after each type
+NEXT_IN_SPLIT = {
+    "upper_body": "lower_body",
+    "lower_body": "upper_body",
+    "chest": "back",
+    "back": "legs",
+    "legs": "shoulders",
+    "shoulders": "arms",
+    "arms": "chest",
+    "full_body": "cardio",
+    "cardio": "full_body",
+    "abs": "full_body",
+    "stretching": "full_body",
+}
+
+# workout_id -> (user_id, user_profile, the completed workout, recent workouts newest first) or None
+ContextLoader = Callable[[str], Awaitable[Optional[Tuple[str, Dict, Dict, List[Dict]]]]]
+# (user_id, user_profile, workout_type, duration_minutes) -> plan
+PlanGenerator = Callable[[str, Dict, str, int], Awaitable[Dict]]
+# (user_profile, workout_type, duration_minutes) -> an already generated plan, without calling the LLM
+PlanLookup = Callable[[Dict, str, int], Optional[Dict]]
+
+
+def predict_next(history: List[Dict], completed: Dict, difficulty: int) -> Tuple[str, int]:
+    """Most likely (workout_type, duration_minutes) for the user's next session"""
+    last_type = completed["workout_type"]
+    types = [w["workout_type"] for w in reversed(history)]
+    successors = Counter(after for before, after in zip(types, types[1:]) if before == last_type)
+    if difficulty >= HARD_RATING:
+        # Too hard: they're unlikely to hit the same muscles again straight away
+        successors.pop(last_type, None)
+    workout_type = successors.most_common(1)[0][0] if successors else NEXT_IN_SPLIT.get(last_type, last_type)
+
+    durations = [w["duration_minutes"] for w in history if w["workout_type"] == workout_type]
+    duration = durations[0] if durations else completed["duration_minutes"]
+    if duration in DURATION_STEPS:
+        step = DURATION_STEPS.index(duration)
+        if difficulty >= HARD_RATING:
+            step = max(step - 1, 0)
+        elif difficulty <= EASY_RATING:
+            step = min(step + 1, len(DURATION_STEPS) - 1)
+        duration = DURATION_STEPS[step]
+    return workout_type, duration
+
+
+@dataclass
+class PendingPlan:
+    workout_type: str
+    duration_minutes: int
+    plan: Dict
+    created_at: float
+
+
+class PreGenerator:
+    """Predicts and generates each user's next workout in the background; generation takes it on a match"""
+
+    def __init__(
+        self,
+        load_context: ContextLoader,
+        generate: PlanGenerator,
+        concurrency: int = PREGEN_CONCURRENCY,
+        max_per_hour: int = PREGEN_MAX_PER_HOUR,
+        ttl_seconds: int = PREGEN_TTL_SECONDS,
+        max_users: int = PREGEN_MAX_USERS,
+        enabled: bool = PREGEN_ENABLED,
+        lookup: Optional[PlanLookup] = None
+    ):
+        self.load_context = load_context
+        self.generate = generate
+        self.lookup = lookup
+        self.concurrency = concurrency
+        self.max_per_hour = max_per_hour
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.enabled = enabled
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=PREGEN_QUEUE_SIZE)
+        self._tasks: List[asyncio.Task] = []
+        # One speculative plan per user: the latest prediction replaces the previous one
+        self._plans: "OrderedDict[str, PendingPlan]" = OrderedDict()
+        self._started_at: Deque[float] = deque()
+
+        self.scheduled = 0
+        self.generated = 0
+        self.reused = 0
+        self.served = 0
+        self.missed = 0
+        self.expired = 0
+        self.over_budget = 0
+        self.failed = 0
+
+    # ---------- plans ----------
+    def _fresh(self, pending: PendingPlan) -> bool:
+        return time.time() - pending.created_at <= self.ttl_seconds
+
+    def take(self, user_id: str, workout_type: str, duration_minutes: int) -> Optional[Dict]:
+        """The pre-generated plan if it matches this request (consumed on use)"""
+        pending = self._plans.get(user_id)
+        if pending is None:
+            return None
+        if not self._fresh(pending):
+            del self._plans[user_id]
+            self.expired += 1
+            return None
+        if (pending.workout_type, pending.duration_minutes) != (workout_type, duration_minutes):
+            self.missed += 1
+            return None
+        del self._plans[user_id]
+        self.served += 1
+        return pending.plan
+
+    def _store(self, user_id: str, pending: PendingPlan):
+        self._plans[user_id] = pending
+        self._plans.move_to_end(user_id)
+        while len(self._plans) > self.max_users:
+            self._plans.popitem(last=False)
+
+    def _purge_expired(self):
+        for user_id in [u for u, p in self._plans.items() if not self._fresh(p)]:
+            del self._plans[user_id]
+            self.expired += 1
+
+    # ---------- spend cap ----------
+    def _spend(self) -> bool:
+        now = time.monotonic()
+        while self._started_at and now - self._started_at[0] > 3600:
+            self._started_at.popleft()
+        if len(self._started_at) >= self.max_per_hour:
+            return False
+        self._started_at.append(now)
+        return True
+
+    # ---------- scheduling ----------
+    def schedule(self, workout_id: str, difficulty: int):
+        """Called when a workout is completed"""
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait((workout_id, difficulty))
+            self.scheduled += 1
+        except asyncio.QueueFull:
+            logger.warning("pre-generation queue full, skipping", extra={"workout_id": workout_id})
+
+    async def _pregenerate(self, workout_id: str, difficulty: int):
+        context = await self.load_context(workout_id)
+        if context is None:
+            return
+        user_id, profile, completed, history = context
+        workout_type, duration = predict_next(history, completed, difficulty)
+
+        pending = self._plans.get(user_id)
+        if pending and self._fresh(pending) and (pending.workout_type, pending.duration_minutes) == (workout_type, duration):
+            return
+
+        # Only an actual LLM call counts against the hourly cap; a cached plan is free
+        plan = self.lookup(profile, workout_type, duration) if self.lookup else None
+        if plan is not None:
+            self._store(user_id, PendingPlan(workout_type, duration, plan, time.time()))
+            self.reused += 1
+            return
+        if not self._spend():
+            self.over_budget += 1
+            return
+
+        # `generate` raises rather than falling back to a rule-based plan, so only LLM plans are kept
+        plan = await self.generate(user_id, profile, workout_type, duration)
+        self._store(user_id, PendingPlan(workout_type, duration, plan, time.time()))
+        self.generated += 1
+        logger.info("pre-generated next workout", extra={
+            "user_id": user_id, "workout_type": workout_type, "duration_minutes": duration
+        })
+
+    async def _worker(self):
+        while True:
+            workout_id, difficulty = await self._queue.get()
+            try:
+                self._purge_expired()
+                await self._pregenerate(workout_id, difficulty)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning("pre-generation failed", extra={"workout_id": workout_id, "error": str(e)})
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        if self.enabled and not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "pending_plans": len(self._plans),
+            "queued": self._queue.qsize(),
+            "scheduled": self.scheduled,
+            "generated": self.generated,
+            "reused": self.reused,
+            "served": self.served,
+            "missed": self.missed,
+            "expired": self.expired,
+            "over_budget": self.over_budget,
+            "failed": self.failed,
+            "generations_last_hour": len(self._started_at),
+        }
@@ -0,0 +1,123 @@
+# profile_cache.py
+"""LRU+TTL cache of `users` rows, optionally backed by Redis so workers share entries"""
+import importlib.util
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from logs import get_logger
+
+logger = get_logger("profile_cache")
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "600"))
+# With a shared backend, other workers may invalidate; keep local copies short-lived
+PROFILE_CACHE_LOCAL_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_LOCAL_TTL_SECONDS", "30"))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_PREFIX = "swole:user:"
+
+
+class ProfileCache:
+    """Per-user profile rows; callers invalidate explicitly on every write"""
+
+    def __init__(
+        self,
+        max_size: int = PROFILE_CACHE_SIZE,
+        ttl_seconds: int = PROFILE_CACHE_TTL_SECONDS,
+        redis_url: Optional[str] = REDIS_URL
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._shared = None
+
+        if redis_url and importlib.util.find_spec("redis") is not None:
+            import redis.asyncio as redis
+            self._shared = redis.from_url(redis_url)
+            self.local_ttl_seconds = min(ttl_seconds, PROFILE_CACHE_LOCAL_TTL_SECONDS)
+        else:
+            if redis_url:
+                logger.warning("REDIS_URL is set but the redis package isn't installed; profile cache is per-process")
+            self.local_ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _local_get(self, user_id: str) -> Optional[Dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.local_ttl_seconds:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    def _local_set(self, user_id: str, row: Dict):
+        self._entries[user_id] = (time.monotonic(), row)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        row = self._local_get(user_id)
+        if row is not None:
+            self.hits += 1
+            return row
+
+        if self._shared is not None:
+            try:
+                raw = await self._shared.get(REDIS_PREFIX + user_id)
+            except Exception as e:
+                logger.warning("profile cache backend error", extra={"error": str(e)})
+                raw = None
+            if raw is not None:
+                row = json.loads(raw)
+                self._local_set(user_id, row)
+                self.shared_hits += 1
+                return row
+
+        self.misses += 1
+        return None
+
+    async def get_many(self, user_ids: List[str]) -> Dict[str, Dict]:
+        found = {}
+        for user_id in user_ids:
+            row = await self.get(user_id)
+            if row is not None:
+                found[user_id] = row
+        return found
+
+    async def set(self, user_id: str, row: Dict):
+        self._local_set(user_id, row)
+        if self._shared is not None:
+            try:
+                await self._shared.set(REDIS_PREFIX + user_id, json.dumps(row), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning("profile cache backend error", extra={"error": str(e)})
+
+    async def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+        if self._shared is not None:
+            try:
+                await self._shared.delete(REDIS_PREFIX + user_id)
+            except Exception as e:
+                logger.warning("profile cache backend error", extra={"error": str(e)})
+
+    async def aclose(self):
+        if self._shared is not None:
+            await self._shared.aclose()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "backend": "redis" if self._shared is not None else "memory",
+            "size": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,309 @@
+# progress.py
+"""Per-user progress rollups: kept current on insert/feedback, rebuilt with NumPy when a user is first read"""
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from logs import get_logger
+from singleflight import SingleFlight
+
+logger = get_logger("progress")
+
+STATS_MAX_USERS = int(os.getenv("STATS_MAX_USERS", "1000"))
+STATS_DIFFICULTY_WINDOW = int(os.getenv("STATS_DIFFICULTY_WINDOW", "10"))
+STATS_WEEKS = int(os.getenv("STATS_WEEKS", "12"))
+# Updates only reach the rollups of the process that handled them; with several workers
+# a rollup is rebuilt after this long so it picks up what the others recorded.
+# serve.py turns it on only when it forks more than one worker.
+STATS_MAX_AGE_SECONDS = int(os.getenv("STATS_MAX_AGE_SECONDS", "300"))
+
+# Volume of exercises the catalog had no muscle data for
+UNSPECIFIED_MUSCLE = "unspecified"
+
+# user_id -> every workout row of theirs (stored and unflushed), in any order
+RowLoader = Callable[[str], Awaitable[List[Dict]]]
+
+
+def _reps(value) -> int:
+    """LLM plans sometimes give reps as "8-12" or "30 seconds"; count the first number"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r"\d+", str(value or ""))
+    return int(match.group()) if match else 0
+
+
+def _day(row: Dict) -> str:
+    return str(row.get("created_at") or "1970-01-01")[:10]
+
+
+def _rating(row: Dict) -> Optional[int]:
+    return (row.get("feedback") or {}).get("difficulty_rating")
+
+
+def exercise_volume(exercises: List[Dict]) -> List[Tuple[str, int]]:
+    """(muscle, sets x reps) for every muscle each exercise works"""
+    volume = []
+    for exercise in exercises or []:
+        amount = _reps(exercise.get("sets")) * _reps(exercise.get("reps"))
+        for muscle in exercise.get("muscles") or [UNSPECIFIED_MUSCLE]:
+            volume.append((muscle or UNSPECIFIED_MUSCLE, amount))
+    return volume
+
+
+def week_starts(days: np.ndarray) -> np.ndarray:
+    """Monday of each date's week (1970-01-01 was a Thursday)"""
+    return days - (days.astype(np.int64) + 3) % 7
+
+
+def week_start(day: str) -> str:
+    """week_starts for a single date"""
+    parsed = date.fromisoformat(day)
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+
+@dataclass
+class WorkoutFacts:
+    """What one workout contributes to the rollup, so feedback can move it in and out"""
+    week: str
+    calories: float
+    volume: List[Tuple[str, int]]
+    completed: bool = False
+    rating: Optional[int] = None
+
+
+@dataclass
+class UserRollup:
+    workouts: Dict[str, WorkoutFacts] = field(default_factory=dict)
+    completed: int = 0
+    volume_by_muscle: Dict[str, float] = field(default_factory=dict)
+    weekly_calories: Dict[str, float] = field(default_factory=dict)
+    rating_sum: float = 0.0
+    rating_count: int = 0
+    recent_ratings: Deque[Tuple[str, int]] = field(default_factory=lambda: deque(maxlen=STATS_DIFFICULTY_WINDOW))
+    built_at: float = field(default_factory=time.time)
+
+    # ---------- incremental ----------
+    def _credit(self, facts: WorkoutFacts, sign: int):
+        """Add (sign=1) or remove (sign=-1) a completed workout's volume and calories"""
+        self.completed += sign
+        for muscle, amount in facts.volume:
+            total = self.volume_by_muscle.get(muscle, 0) + sign * amount
+            if total:
+                self.volume_by_muscle[muscle] = total
+            else:
+                self.volume_by_muscle.pop(muscle, None)
+        calories = self.weekly_calories.get(facts.week, 0.0) + sign * facts.calories
+        if abs(calories) > 1e-6:
+            self.weekly_calories[facts.week] = calories
+        else:
+            self.weekly_calories.pop(facts.week, None)
+
+    def add(self, row: Dict):
+        """A new workout; a no-op for one the rollup already counts"""
+        workout_id = row["workout_id"]
+        if workout_id in self.workouts:
+            return
+        self.workouts[workout_id] = WorkoutFacts(
+            week=week_start(_day(row)),
+            calories=float(row.get("estimated_calories") or 0),
+            volume=exercise_volume(row.get("exercises"))
+        )
+        if row.get("completed") or _rating(row) is not None:
+            self.apply_feedback(workout_id, bool(row.get("completed")), _rating(row))
+
+    def apply_feedback(self, workout_id: str, completed: bool, rating: Optional[int]) -> bool:
+        """Set a workout's completion and rating, replacing whatever feedback it had before"""
+        facts = self.workouts.get(workout_id)
+        if facts is None:
+            return False
+        if facts.completed != completed:
+            self._credit(facts, 1 if completed else -1)
+            facts.completed = completed
+        if facts.rating is not None:
+            self.rating_sum -= facts.rating
+            self.rating_count -= 1
+            kept = [r for r in self.recent_ratings if r[0] != workout_id]
+            self.recent_ratings.clear()
+            self.recent_ratings.extend(kept)
+        facts.rating = rating
+        if rating is not None:
+            self.rating_sum += rating
+            self.rating_count += 1
+            self.recent_ratings.append((workout_id, rating))
+        return True
+
+    # ---------- serving ----------
+    def snapshot(self, weeks: int = STATS_WEEKS) -> Dict:
+        total = len(self.workouts)
+        recent = [rating for _, rating in self.recent_ratings]
+        return {
+            "total_workouts": total,
+            "completed_workouts": self.completed,
+            "completion_rate": round(self.completed / total, 3) if total else 0.0,
+            "volume_by_muscle": [
+                {"muscle": muscle, "volume": int(volume)}
+                for muscle, volume in sorted(self.volume_by_muscle.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            "weekly_calories": [
+                {"week_start": week, "calories": round(calories, 1)}
+                for week, calories in sorted(self.weekly_calories.items())[-weeks:]
+            ],
+            "difficulty": {
+                "rolling_average": round(sum(recent) / len(recent), 2) if recent else None,
+                "window": len(recent),
+                "average": round(self.rating_sum / self.rating_count, 2) if self.rating_count else None,
+                "ratings": self.rating_count,
+            },
+        }
+
+
+def build_rollup(rows: List[Dict]) -> UserRollup:
+    """Recompute a user's rollup from scratch over columnar arrays"""
+    rollup = UserRollup()
+    if not rows:
+        return rollup
+    rows = sorted(rows, key=lambda r: (str(r.get("created_at") or ""), r["workout_id"]))
+
+    weeks = week_starts(np.array([_day(r) for r in rows], dtype="datetime64[D]")).astype(str)
+    calories = np.array([float(r.get("estimated_calories") or 0) for r in rows])
+    completed = np.array([bool(r.get("completed")) for r in rows])
+    ratings = np.array([np.nan if _rating(r) is None else _rating(r) for r in rows], dtype=float)
+
+    volumes = [exercise_volume(r.get("exercises")) for r in rows]
+    owners = np.repeat(np.arange(len(rows)), [len(v) for v in volumes])
+    muscles = np.array([muscle for v in volumes for muscle, _ in v], dtype=object)
+    amounts = np.array([amount for v in volumes for _, amount in v], dtype=float)
+
+    # Volume per muscle, completed workouts only
+    done = completed[owners]
+    if done.any():
+        names, codes = np.unique(muscles[done].astype(str), return_inverse=True)
+        totals = np.bincount(codes, weights=amounts[done], minlength=len(names))
+        rollup.volume_by_muscle = {str(name): float(total) for name, total in zip(names, totals) if total}
+
+    # Calories per week, completed workouts only
+    if completed.any():
+        week_keys, week_codes = np.unique(weeks[completed], return_inverse=True)
+        sums = np.bincount(week_codes, weights=calories[completed], minlength=len(week_keys))
+        rollup.weekly_calories = {str(week): float(total) for week, total in zip(week_keys, sums) if total}
+
+    rated = ~np.isnan(ratings)
+    rollup.completed = int(completed.sum())
+    rollup.rating_count = int(rated.sum())
+    rollup.rating_sum = float(ratings[rated].sum())
+    for i in np.flatnonzero(rated)[-STATS_DIFFICULTY_WINDOW:]:
+        rollup.recent_ratings.append((rows[i]["workout_id"], int(ratings[i])))
+
+    for i, row in enumerate(rows):
+        rollup.workouts[row["workout_id"]] = WorkoutFacts(
+            week=str(weeks[i]),
+            calories=float(calories[i]),
+            volume=volumes[i],
+            completed=bool(completed[i]),
+            rating=None if not rated[i] else int(ratings[i])
+        )
+    return rollup
+
+
+class ProgressRollups:
+    """Rollups for recently read users; serving one costs the same however long their history is"""
+
+    def __init__(
+        self,
+        load_rows: RowLoader,
+        max_users: int = STATS_MAX_USERS,
+        max_age_seconds: Optional[int] = None
+    ):
+        self.load_rows = load_rows
+        self.max_users = max_users
+        self.max_age_seconds = max_age_seconds
+        self._rollups: "OrderedDict[str, UserRollup]" = OrderedDict()
+        # workout_id -> user_id, for the users that have a rollup
+        self._owners: Dict[str, str] = {}
+        # Updates that arrive mid-backfill, replayed once it lands (both kinds are idempotent)
+        self._loading: Dict[str, List[Tuple]] = {}
+        self._backfills = SingleFlight("progress_backfill")
+
+        self.hits = 0
+        self.backfills = 0
+        self.updates = 0
+
+    # ---------- updates ----------
+    def record_workout(self, row: Dict):
+        user_id = row["user_id"]
+        if user_id in self._loading:
+            self._loading[user_id].append(("workout", row))
+            return
+        rollup = self._rollups.get(user_id)
+        if rollup is None:
+            # Not loaded: the next read backfills it, this workout included
+            return
+        rollup.add(row)
+        self._owners[row["workout_id"]] = user_id
+        self.updates += 1
+
+    def record_feedback(self, workout_id: str, completed: bool, difficulty_rating: Optional[int]):
+        for buffered in self._loading.values():
+            buffered.append(("feedback", workout_id, completed, difficulty_rating))
+        user_id = self._owners.get(workout_id)
+        if user_id is not None and self._rollups[user_id].apply_feedback(workout_id, completed, difficulty_rating):
+            self.updates += 1
+
+    # ---------- reads ----------
+    async def _backfill(self, user_id: str) -> UserRollup:
+        self._loading[user_id] = []
+        try:
+            rows = await self.load_rows(user_id)
+            rollup = await asyncio.to_thread(build_rollup, rows)
+            for update in self._loading[user_id]:
+                if update[0] == "workout":
+                    rollup.add(update[1])
+                else:
+                    rollup.apply_feedback(*update[1:])
+        finally:
+            buffered = self._loading.pop(user_id)
+
+        self.backfills += 1
+        logger.info("progress rollup rebuilt", extra={
+            "user_id": user_id, "workouts": len(rollup.workouts), "replayed": len(buffered)
+        })
+        self._rollups[user_id] = rollup
+        # Reassigning a stale entry keeps its old LRU slot; a fresh rebuild is the most recently used
+        self._rollups.move_to_end(user_id)
+        for workout_id in rollup.workouts:
+            self._owners[workout_id] = user_id
+        while len(self._rollups) > self.max_users:
+            _, evicted = self._rollups.popitem(last=False)
+            for workout_id in evicted.workouts:
+                self._owners.pop(workout_id, None)
+        return rollup
+
+    async def get(self, user_id: str) -> Dict:
+        rollup = self._rollups.get(user_id)
+        if rollup is not None and self.max_age_seconds and time.time() - rollup.built_at > self.max_age_seconds:
+            rollup = None
+        if rollup is not None:
+            self._rollups.move_to_end(user_id)
+            self.hits += 1
+        else:
+            rollup = await self._backfills.do(user_id, lambda: self._backfill(user_id))
+        return rollup.snapshot()
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._rollups),
+            "max_users": self.max_users,
+            "max_age_seconds": self.max_age_seconds,
+            "workouts_indexed": len(self._owners),
+            "loading": len(self._loading),
+            "hits": self.hits,
+            "backfills": self.backfills,
+            "updates": self.updates,
+        }
@@ -0,0 +1,200 @@
+# prompts.py
+"""Token-budgeted prompt building for workout generation"""
+import html
+import importlib.util
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from planner import equipment_ok, normalize_name
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+PROMPT_MAX_CANDIDATES = int(os.getenv("PROMPT_MAX_CANDIDATES", "30"))
+PROMPT_DESCRIPTION_CHARS = int(os.getenv("PROMPT_DESCRIPTION_CHARS", "60"))
+PROMPT_MIN_CANDIDATES = 6
+
+WORKOUT_SYSTEM_PROMPT = "You are an expert personal trainer who creates safe, effective workouts. Return only valid JSON."
+
+WORKOUT_PROMPT_TEMPLATE = """Create a personalized {duration_minutes}-minute workout.
+
+USER PROFILE:
+- Age: {age}
+- Fitness Level: {fitness_level}
+- Goals: {goals}
+- Medical Conditions: {medical_conditions}
+
+WORKOUT TYPE: {workout_type}
+
+AVAILABLE EXERCISES (id|name|muscles|equipment|notes):
+{exercise_table}
+
+INSTRUCTIONS:
+1. Select 4-6 appropriate exercises from the list above, by id
+2. Order them logically (warm-up → intense → cool-down)
+3. Assign sets, reps, and rest periods based on fitness level
+4. Provide 3-4 specific coaching cues per exercise
+5. Calculate estimated calories burned
+
+Return ONLY valid JSON with this structure:
+{{"exercises":[{{"id":<exercise_id>,"name":"<exercise_name>","sets":<number>,"reps":<number>,"rest_seconds":<number>,"coaching_cues":["<cue1>","<cue2>","<cue3>"],"why_chosen":"<brief reason>"}}],"estimated_calories":<number>,"workout_notes":"<motivational message>"}}"""
+
+# Goal words that favour multi-joint movements
+COMPOUND_GOALS = {"strength", "muscle", "build", "bulk", "power", "hypertrophy", "tone"}
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+if importlib.util.find_spec("tiktoken") is not None:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_ENCODING.encode(text))
+
+    def truncate_tokens(text: str, max_tokens: int) -> str:
+        tokens = _ENCODING.encode(text)
+        return text if len(tokens) <= max_tokens else _ENCODING.decode(tokens[:max_tokens])
+else:
+    def count_tokens(text: str) -> int:
+        """~4 characters per token for English text"""
+        return (len(text) + 3) // 4
+
+    def truncate_tokens(text: str, max_tokens: int) -> str:
+        return text[:max_tokens * 4]
+
+
+def strip_html(text: str) -> str:
+    return _SPACE_RE.sub(" ", html.unescape(_TAG_RE.sub(" ", text or ""))).strip()
+
+
+def _cell(text: str) -> str:
+    return text.replace("|", "/").replace("\n", " ")
+
+
+def exercise_row(ex: Dict, description_chars: int = PROMPT_DESCRIPTION_CHARS) -> str:
+    """One compact `id|name|muscles|equipment|notes` line"""
+    muscles = ",".join(m.get("name") for m in ex.get("muscles", []) if m.get("name"))
+    equipment = ",".join(e.get("name") for e in ex.get("equipment", []) if e.get("name"))
+    notes = strip_html(ex.get("description", ""))[:description_chars] if description_chars else ""
+    return "|".join(_cell(str(v)) for v in (ex.get("id"), ex.get("name", ""), muscles, equipment, notes))
+
+
+class PromptBuilder:
+    """Pre-filters candidates and packs them into a prompt under a token budget"""
+
+    def __init__(
+        self,
+        token_budget: int = PROMPT_TOKEN_BUDGET,
+        max_candidates: int = PROMPT_MAX_CANDIDATES,
+        description_chars: int = PROMPT_DESCRIPTION_CHARS
+    ):
+        self.token_budget = token_budget
+        self.max_candidates = max_candidates
+        self.description_chars = description_chars
+        self.system_prompt_tokens = count_tokens(WORKOUT_SYSTEM_PROMPT)
+        # exercise id -> (the exercise dict it was built from, row, tokens)
+        self._rows: Dict[Any, Tuple[Dict, str, int]] = {}
+        self.prompts_built = 0
+        self.total_prompt_tokens = 0
+
+    def _row(self, ex: Dict) -> Tuple[str, int]:
+        """Prompt row and its token count, reused while the catalog holds the same exercise dict"""
+        cached = self._rows.get(ex.get("id"))
+        if cached is not None and cached[0] is ex:
+            return cached[1], cached[2]
+        row = exercise_row(ex, self.description_chars)
+        tokens = count_tokens(row) + 1
+        self._rows[ex.get("id")] = (ex, row, tokens)
+        return row, tokens
+
+    def warm(self, exercises: Iterable[Dict]) -> int:
+        """Render every catalog exercise's row up front (before forking workers, so they share them)"""
+        for ex in exercises:
+            self._row(ex)
+        return len(self._rows)
+
+    def select_candidates(
+        self,
+        exercises: List[Dict],
+        goals: List[str],
+        equipment_available: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Equipment-compatible exercises, most goal-relevant first, spread across muscle groups"""
+        allowed = frozenset(normalize_name(e) for e in equipment_available) if equipment_available else None
+        usable = [ex for ex in exercises if equipment_ok(ex, allowed)] or list(exercises)
+
+        goal_words = {normalize_name(w) for goal in goals for w in goal.split()}
+        prefers_compound = bool(goal_words & {normalize_name(w) for w in COMPOUND_GOALS})
+
+        def score(ex: Dict) -> Tuple:
+            text = f"{ex.get('name', '')} {(ex.get('category') or {}).get('name', '')}".lower()
+            keyword_hits = sum(1 for w in goal_words if w and w in text)
+            muscle_count = len(ex.get("muscles", [])) + len(ex.get("muscles_secondary", []))
+            return (-keyword_hits, -muscle_count if prefers_compound else 0, not ex.get("images"), ex.get("id") or 0)
+
+        groups: Dict[str, List[Dict]] = {}
+        for ex in sorted(usable, key=score):
+            muscles = ex.get("muscles") or [{}]
+            groups.setdefault(muscles[0].get("name") or "", []).append(ex)
+
+        # Round-robin over muscle groups so the LLM sees a balanced menu
+        selected: List[Dict] = []
+        queues = list(groups.values())
+        depth = 0
+        while len(selected) < self.max_candidates and any(depth < len(q) for q in queues):
+            for queue in queues:
+                if depth < len(queue) and len(selected) < self.max_candidates:
+                    selected.append(queue[depth])
+            depth += 1
+        return selected
+
+    def build_workout_prompt(
+        self,
+        user_profile: Dict,
+        workout_type: str,
+        duration_minutes: int,
+        exercises: List[Dict],
+        equipment_available: Optional[List[str]] = None
+    ) -> Tuple[str, Dict]:
+        """Prompt text plus stats (tokens, exercises offered) for this request"""
+        candidates = self.select_candidates(exercises, user_profile.get("goals", []), equipment_available)
+
+        fields = {
+            "duration_minutes": duration_minutes,
+            "age": user_profile["age"],
+            "fitness_level": user_profile["fitness_level"],
+            "goals": ", ".join(user_profile["goals"]),
+            "medical_conditions": ", ".join(user_profile.get("medical_conditions") or []) or "None",
+            "workout_type": workout_type,
+        }
+        if equipment_available:
+            fields["workout_type"] += f" (equipment: {', '.join(equipment_available)})"
+
+        tokens = self.system_prompt_tokens + count_tokens(
+            WORKOUT_PROMPT_TEMPLATE.format(exercise_table="", **fields)
+        )
+        rows = []
+        for ex in candidates:
+            row, row_tokens = self._row(ex)
+            if tokens + row_tokens > self.token_budget and len(rows) >= PROMPT_MIN_CANDIDATES:
+                break
+            rows.append(row)
+            tokens += row_tokens
+
+        prompt = WORKOUT_PROMPT_TEMPLATE.format(exercise_table="\n".join(rows), **fields)
+
+        self.prompts_built += 1
+        self.total_prompt_tokens += tokens
+        return prompt, {
+            "prompt_tokens": tokens,
+            "exercises_offered": len(rows),
+            "exercises_considered": len(exercises),
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "token_budget": self.token_budget,
+            "cached_rows": len(self._rows),
+            "prompts_built": self.prompts_built,
+            "avg_prompt_tokens": round(self.total_prompt_tokens / self.prompts_built) if self.prompts_built else 0,
+        }
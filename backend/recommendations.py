@@ -0,0 +1,138 @@
+# recommendations.py
+"""Background worker pool that writes LLM feedback recommendations onto workout rows"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from logs import get_logger
+
+logger = get_logger("recommendations")
+
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", "4"))
+RECOMMENDATION_QUEUE_SIZE = int(os.getenv("RECOMMENDATION_QUEUE_SIZE", "1000"))
+RECOMMENDATION_MAX_TRACKED = 10000
+RECOMMENDATION_TRACK_SECONDS = 3600
+
+PENDING = "pending"
+READY = "ready"
+
+# feedback -> recommendation text
+Generator = Callable[[Dict], Awaitable[str]]
+# (workout_id, changes) -> None; expected to be non-blocking (write-behind)
+Store = Callable[[str, Dict], None]
+
+
+class RecommendationWorkers:
+    """Feedback is answered with a rule-based message at once; the LLM version follows from a worker"""
+
+    def __init__(
+        self,
+        generate: Generator,
+        store: Store,
+        workers: int = RECOMMENDATION_WORKERS,
+        queue_size: int = RECOMMENDATION_QUEUE_SIZE
+    ):
+        self.generate = generate
+        self.store = store
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        # Recent jobs by workout id, so pollers can tell "still generating" from "final"
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._done: Dict[str, asyncio.Event] = {}
+
+        self.generated = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _finish(self, workout_id: str, recommendation: str, source: str):
+        job = self._jobs.get(workout_id)
+        if job is not None:
+            job.update(status=READY, recommendation=recommendation, source=source, updated_at=time.time())
+        event = self._done.pop(workout_id, None)
+        if event is not None:
+            event.set()
+
+    def submit(self, workout_id: str, feedback: Dict, fallback: str):
+        """Queue an LLM recommendation; `fallback` stands until (or unless) it arrives"""
+        self._jobs[workout_id] = {
+            "status": PENDING,
+            "recommendation": fallback,
+            "source": "rules",
+            "updated_at": time.time()
+        }
+        self._jobs.move_to_end(workout_id)
+        while len(self._jobs) > RECOMMENDATION_MAX_TRACKED:
+            stale_id, _ = self._jobs.popitem(last=False)
+            self._finish(stale_id, fallback, "rules")
+        self._done.setdefault(workout_id, asyncio.Event())
+
+        try:
+            self._queue.put_nowait((workout_id, feedback))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._finish(workout_id, fallback, "rules")
+
+    def status(self, workout_id: str) -> Optional[Dict]:
+        job = self._jobs.get(workout_id)
+        if job is None or time.time() - job["updated_at"] > RECOMMENDATION_TRACK_SECONDS:
+            return None
+        return dict(job)
+
+    async def wait(self, workout_id: str, timeout: float) -> Optional[Dict]:
+        """The job once it's final, or as it stands after `timeout` seconds"""
+        event = self._done.get(workout_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.status(workout_id)
+
+    async def _worker(self):
+        while True:
+            workout_id, feedback = await self._queue.get()
+            try:
+                recommendation = await self.generate(feedback)
+                self.store(workout_id, {"recommendation": recommendation})
+                self.generated += 1
+                self._finish(workout_id, recommendation, "ai")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The rule-based message is already on the row; just stop waiting for a better one
+                self.failed += 1
+                logger.warning(
+                    "recommendation failed, keeping rule-based message",
+                    extra={"workout_id": workout_id, "error": str(e)}
+                )
+                job = self._jobs.get(workout_id)
+                self._finish(workout_id, job["recommendation"] if job else "", "rules")
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; anything still queued keeps its rule-based message"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for event in self._done.values():
+            event.set()
+        self._done.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "in_progress": sum(1 for job in self._jobs.values() if job["status"] == PENDING),
+            "generated": self.generated,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
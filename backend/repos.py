@@ -0,0 +1,173 @@
+# repos.py
+"""Non-blocking Supabase access: sync client calls run on a bounded thread pool"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from supabase import Client
+
+from metrics import UPSTREAM_DURATION, record_upstream_error
+from profile_cache import ProfileCache
+
+SUPABASE_MAX_WORKERS = int(os.getenv("SUPABASE_MAX_WORKERS", "16"))
+
+
+class Database:
+    """Owns the Supabase client and the thread pool its blocking calls run on"""
+
+    def __init__(self, client: Optional[Client] = None, max_workers: int = SUPABASE_MAX_WORKERS):
+        # Set in the app lifespan, so forked workers don't share one client's connections
+        self.client = client
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="supabase"
+            )
+        return self._executor
+
+    async def run(self, query: Callable[[Client], Any]) -> Any:
+        """Run `query(client)` off the event loop and return its result"""
+        if self.client is None:
+            raise RuntimeError("Supabase is not configured (set SUPABASE_URL and SUPABASE_KEY)")
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, query, self.client)
+        except Exception as e:
+            record_upstream_error("supabase", e)
+            raise
+        finally:
+            UPSTREAM_DURATION.labels(upstream="supabase").observe(time.perf_counter() - started)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class UserRepo:
+    """Rows in the `users` table, read through an optional profile cache"""
+
+    def __init__(self, db: Database, cache: Optional[ProfileCache] = None):
+        self.db = db
+        self.cache = cache
+
+    async def create(self, row: Dict) -> List[Dict]:
+        result = await self.db.run(lambda c: c.table('users').insert(row).execute())
+        if self.cache:
+            await self.cache.invalidate(row['user_id'])
+        return result.data
+
+    async def update(self, user_id: str, changes: Dict) -> List[Dict]:
+        result = await self.db.run(
+            lambda c: c.table('users').update(changes).eq('user_id', user_id).execute()
+        )
+        if self.cache:
+            await self.cache.invalidate(user_id)
+        return result.data
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        if self.cache:
+            cached = await self.cache.get(user_id)
+            if cached is not None:
+                return cached
+
+        result = await self.db.run(
+            lambda c: c.table('users').select('*').eq('user_id', user_id).execute()
+        )
+        user = result.data[0] if result.data else None
+        if user and self.cache:
+            await self.cache.set(user_id, user)
+        return user
+
+    async def get_many(self, user_ids: List[str]) -> List[Dict]:
+        found = await self.cache.get_many(user_ids) if self.cache else {}
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if not missing:
+            return list(found.values())
+
+        result = await self.db.run(
+            lambda c: c.table('users').select('*').in_('user_id', missing).execute()
+        )
+        if self.cache:
+            for user in result.data:
+                await self.cache.set(user['user_id'], user)
+        return list(found.values()) + result.data
+
+    async def ping(self):
+        await self.db.run(lambda c: c.table('users').select('count').limit(1).execute())
+
+
+class WorkoutRepo:
+    """Rows in the `workouts` table"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def create(self, row: Dict) -> List[Dict]:
+        result = await self.db.run(lambda c: c.table('workouts').insert(row).execute())
+        return result.data
+
+    async def upsert_many(self, rows: List[Dict]) -> List[Dict]:
+        """Bulk insert that is safe to retry"""
+        result = await self.db.run(
+            lambda c: c.table('workouts').upsert(rows, on_conflict='workout_id').execute()
+        )
+        return result.data
+
+    async def get(self, workout_id: str) -> Optional[Dict]:
+        result = await self.db.run(
+            lambda c: c.table('workouts').select('*').eq('workout_id', workout_id).execute()
+        )
+        return result.data[0] if result.data else None
+
+    async def update(self, workout_id: str, changes: Dict) -> List[Dict]:
+        result = await self.db.run(
+            lambda c: c.table('workouts').update(changes).eq('workout_id', workout_id).execute()
+        )
+        return result.data
+
+    async def page_for_user(
+        self,
+        user_id: str,
+        limit: int,
+        columns: Sequence[str] = ('*',),
+        before: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        """Newest-first keyset page; `before` is the (created_at, workout_id) of the previous page's last row"""
+        def query(c: Client):
+            q = c.table('workouts').select(*columns).eq('user_id', user_id)
+            if before:
+                created_at, workout_id = before
+                q = q.or_(
+                    f'created_at.lt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",workout_id.lt."{workout_id}")'
+                )
+            return q.order('created_at', desc=True).order('workout_id', desc=True).limit(limit).execute()
+
+        result = await self.db.run(query)
+        return result.data
+
+    async def all_for_user(self, user_id: str, columns: Sequence[str] = ('*',), page_size: int = 1000) -> List[Dict]:
+        """Every workout of a user, newest first, fetched in keyset pages"""
+        rows: List[Dict] = []
+        before = None
+        while True:
+            page = await self.page_for_user(user_id, page_size, columns, before)
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            before = (page[-1]['created_at'], page[-1]['workout_id'])
+
+    async def count_for_user(self, user_id: str) -> int:
+        result = await self.db.run(
+            lambda c: c.table('workouts').select('workout_id', count='exact', head=True).eq('user_id', user_id).execute()
+        )
+        return result.count or 0
@@ -0,0 +1,179 @@
+# serve.py
+"""Production entry point: python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+
+The parent imports the app once, loads the exercise catalog snapshot and renders the prompt rows,
+then forks the workers. They share all of that copy-on-write, accept on one listening socket,
+and only build their own clients and background tasks in the app lifespan.
+
+With more than one worker:
+- All workers append to one write-behind journal and serve read-your-writes from it;
+  only worker 0 flushes it to Supabase.
+- Only worker 0 downloads the exercise catalog when it goes stale; the others reload the
+  snapshot it writes.
+- LLM concurrency caps and the pre-generation budget are divided between the workers.
+- Stats rollups are rebuilt after STATS_MAX_AGE_SECONDS to pick up other workers' updates.
+Still per worker: pre-generated plans (a request on another worker just generates), the status
+of AI recommendations in progress (another worker reports the stored rule-based one as ready),
+conversation summaries (rebuilt by whichever worker a turn lands on) and /metrics (each scrape
+sees one worker's counters).
+"""
+from startup import startup_timer  # first, so the app import is timed
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+import http_clients
+import progress
+from logs import get_logger
+
+logger = get_logger("serve")
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# How long workers get to finish in-flight requests and flush on shutdown
+GRACEFUL_TIMEOUT_SECONDS = float(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30"))
+# A worker that dies sooner than this after starting is restarted after a pause, not in a tight loop
+MIN_WORKER_UPTIME_SECONDS = 1.0
+
+
+# ---------- preloading ----------
+def preload(backend):
+    """Work every worker would otherwise repeat, done once in the parent"""
+    with startup_timer.phase("http_stack"):
+        http_clients.preload()
+    with startup_timer.phase("catalog_snapshot"):
+        backend.exercise_catalog.load()
+    with startup_timer.phase("prompt_rows"):
+        backend.prompt_builder.warm(backend.exercise_catalog.exercises.values())
+    # Nothing allocated so far is ever collected: a GC pass in a worker would otherwise
+    # write to (and so copy) every shared page just to update its bookkeeping
+    gc.freeze()
+
+
+# ---------- workers ----------
+def run_worker(backend, args: argparse.Namespace, sock: Optional[socket.socket] = None):
+    import uvicorn
+
+    # MetricsMiddleware already writes one access log line per request
+    config = uvicorn.Config(backend.app, host=args.host, port=args.port, access_log=False)
+    uvicorn.Server(config).run(sockets=[sock] if sock else None)
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn(backend, args: argparse.Namespace, sock: socket.socket, slot: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 1
+    try:
+        # Own process group: Ctrl+C reaches only the parent, which then stops workers once
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        startup_timer.forked()
+        backend.write_behind.share(flusher=slot == 0)
+        if slot != 0:
+            backend.exercise_catalog.follow()
+        run_worker(backend, args, sock)
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except Exception:
+        logger.exception("worker crashed", extra={"slot": slot})
+    finally:
+        os._exit(code)
+
+
+def supervise(backend, args: argparse.Namespace, sock: socket.socket):
+    """Keep `args.workers` workers running until SIGTERM/SIGINT, then stop them gracefully"""
+    workers: Dict[int, Tuple[int, float]] = {}
+    for slot in range(args.workers):
+        workers[spawn(backend, args, sock, slot)] = (slot, time.monotonic())
+
+    stopping: List[float] = []
+
+    def stop(signum, frame):
+        if stopping:
+            return
+        stopping.append(time.monotonic())
+        logger.info("stopping workers", extra={"signal": signal.Signals(signum).name, "workers": len(workers)})
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() - stopping[0] > GRACEFUL_TIMEOUT_SECONDS:
+                logger.warning("workers did not stop in time, killing them", extra={"workers": len(workers)})
+                for pid in workers:
+                    os.kill(pid, signal.SIGKILL)
+            time.sleep(0.1)
+            continue
+
+        slot, started = workers.pop(pid, (None, 0.0))
+        if slot is None or stopping:
+            continue
+        logger.warning("worker exited, restarting", extra={
+            "slot": slot, "pid": pid, "exit_code": os.waitstatus_to_exitcode(status)
+        })
+        if time.monotonic() - started < MIN_WORKER_UPTIME_SECONDS:
+            time.sleep(MIN_WORKER_UPTIME_SECONDS)
+        workers[spawn(backend, args, sock, slot)] = (slot, time.monotonic())
+
+
+def main(backend=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-w", "--workers", type=int, default=WEB_CONCURRENCY, help="worker processes (WEB_CONCURRENCY)")
+    args = parser.parse_args()
+
+    if backend is None:
+        import backend
+
+    print("\n" + "="*70)
+    print("  AI FITNESS TRAINER - Dedalus Labs Edition")
+    print("="*70)
+    print(f"\n  Server: http://localhost:{args.port}")
+    print(f"  Docs: http://localhost:{args.port}/docs")
+    print(f"  Workers: {max(args.workers, 1)}")
+    print("\n" + "="*70 + "\n")
+
+    preload(backend)
+    if args.workers <= 1:
+        run_worker(backend, args)
+        return
+
+    # A worker's stats rollups miss what the others recorded, so they're rebuilt now and then
+    backend.progress_rollups.max_age_seconds = progress.STATS_MAX_AGE_SECONDS
+    # Limits meant for the whole deployment, not for each copy of it
+    backend.llm_gateway.divide(args.workers)
+    backend.pregenerator.max_per_hour = max(1, backend.pregenerator.max_per_hour // args.workers)
+    sock = bind(args.host, args.port)
+    logger.info("preloaded, forking workers", extra={"workers": args.workers, **startup_timer.report()})
+    supervise(backend, args, sock)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# startup.py
+"""Where the time from process start to readiness goes (imported first so it sees every other import)"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StartupTimer:
+    """Import sections are recorded with mark(), lifespan steps with phase()"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._last = self.started
+        self.worker_started: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.pid = os.getpid()
+
+    def mark(self, name: str):
+        """Time since the previous mark, e.g. one block of module imports"""
+        now = time.perf_counter()
+        self.phases[name] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+            self._last = time.perf_counter()
+
+    def forked(self):
+        """Called in a worker: what the parent already did is shared, not repeated"""
+        self.worker_started = time.perf_counter()
+        self.pid = os.getpid()
+        self.phases = {f"parent.{name}": ms for name, ms in self.phases.items()}
+        self.ready_at = None
+
+    def ready(self):
+        self.ready_at = time.perf_counter()
+
+    def report(self) -> Dict:
+        ready_ms = None
+        if self.ready_at is not None:
+            ready_ms = round((self.ready_at - (self.worker_started or self.started)) * 1000, 1)
+        return {
+            "pid": self.pid,
+            "forked": self.worker_started is not None,
+            # From process start, or from the fork for a pre-forked worker
+            "ready_ms": ready_ms,
+            "phases_ms": dict(self.phases),
+        }
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,205 @@
+# uploads.py
+"""Chat image uploads: size-limited before parsing, downscaled off the event loop, expired after a TTL"""
+import asyncio
+import base64
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.responses import JSONResponse
+
+from logs import get_logger
+
+logger = get_logger("uploads")
+
+UPLOAD_DIR = os.getenv(
+    "UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# Multipart boundaries and part headers on top of the file itself
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+# Checked against the header before decoding: a tiny file can declare a huge canvas
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Images are only referenced by the chat turn they were uploaded for
+IMAGE_TTL_SECONDS = int(os.getenv("IMAGE_TTL_SECONDS", str(24 * 3600)))
+IMAGE_SWEEP_SECONDS = 3600
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+IMAGE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+if IMAGE_FORMAT not in CONTENT_TYPES:
+    raise ValueError(f"IMAGE_FORMAT must be one of {', '.join(CONTENT_TYPES)}, got {IMAGE_FORMAT!r}")
+
+
+class ImageTooLarge(Exception):
+    """The image declares more pixels than IMAGE_MAX_PIXELS"""
+
+
+def _downscale(src: BinaryIO, dest_path: str) -> Dict:
+    """Decode, fix orientation, shrink to IMAGE_MAX_SIDE and re-encode (runs in the worker pool)"""
+    src.seek(0)
+    with Image.open(src) as img:
+        # Only the header has been read so far
+        if img.width * img.height > IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(f"{img.width}x{img.height}")
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale directly; a no-op for other formats
+        img.draft(img.mode, (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(dest_path, IMAGE_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+        width, height = img.size
+    return {"width": width, "height": height, "bytes": os.path.getsize(dest_path)}
+
+
+class UploadSizeLimit:
+    """ASGI middleware: refuse an oversized upload before its multipart body is parsed and spooled"""
+
+    def __init__(self, app, path: str, max_bytes: int = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope.get("headers") or []).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": "Image too large"}, status_code=413)(scope, receive, send)
+            return
+
+        # Chunked or understated bodies: stop reading as soon as the limit is passed
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Image too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class ImageStore:
+    """Downscaled chat images on local disk, referenced by an opaque image id"""
+
+    def __init__(
+        self,
+        directory: str = UPLOAD_DIR,
+        workers: int = IMAGE_WORKERS,
+        ttl_seconds: int = IMAGE_TTL_SECONDS
+    ):
+        self.directory = directory
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+        self.expired = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="images")
+        return self._executor
+
+    def _path(self, image_id: str) -> str:
+        if not IMAGE_ID_RE.match(image_id):
+            raise HTTPException(status_code=400, detail="Invalid image id")
+        return os.path.join(self.directory, f"{image_id}.{EXTENSIONS[IMAGE_FORMAT]}")
+
+    async def save(self, upload: UploadFile) -> Dict:
+        """Downscale the already-spooled upload in the worker pool (UploadSizeLimit capped its size)"""
+        if upload.content_type and not upload.content_type.startswith("image/"):
+            raise HTTPException(status_code=415, detail="Only image uploads are supported")
+        if upload.size is not None and upload.size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Image too large")
+
+        os.makedirs(self.directory, exist_ok=True)
+        image_id = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        try:
+            info = await loop.run_in_executor(self.executor, _downscale, upload.file, self._path(image_id))
+        except (ImageTooLarge, Image.DecompressionBombError):
+            raise HTTPException(status_code=413, detail="Image dimensions too large")
+        except (UnidentifiedImageError, OSError):
+            raise HTTPException(status_code=400, detail="Could not read image")
+
+        return {
+            "image_id": image_id,
+            "content_type": CONTENT_TYPES[IMAGE_FORMAT],
+            "original_bytes": upload.size,
+            **info
+        }
+
+    # ---------- expiry ----------
+    def sweep(self) -> int:
+        """Delete images older than the TTL (and spool files a crash left behind)"""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                # Another worker swept it first
+                pass
+        self.expired += removed
+        return removed
+
+    async def _sweep_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                removed = await loop.run_in_executor(self.executor, self.sweep)
+                if removed:
+                    logger.info("expired chat images", extra={"removed": removed})
+            except Exception:
+                logger.exception("image sweep failed")
+            await asyncio.sleep(IMAGE_SWEEP_SECONDS)
+
+    async def start(self):
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def data_url(self, image_id: str) -> str:
+        """The stored image as a data: URL for the vision model"""
+        try:
+            with open(self._path(image_id), "rb") as f:
+                encoded = base64.b64encode(f.read()).decode()
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return f"data:{CONTENT_TYPES[IMAGE_FORMAT]};base64,{encoded}"
@@ -0,0 +1,394 @@
+# write_behind.py
+"""Durable write-behind queue: workout writes land in a local SQLite journal and flush to Supabase in batches"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from logs import get_logger
+
+logger = get_logger("write_behind")
+
+WRITE_BEHIND_PATH = os.getenv(
+    "WRITE_BEHIND_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "write_behind.sqlite3")
+)
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "8"))
+WRITE_BEHIND_BACKOFF_SECONDS = 1.0
+WRITE_BEHIND_MAX_BACKOFF_SECONDS = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF_SECONDS", "60"))
+
+INSERT_WORKOUT = "insert_workout"
+UPDATE_WORKOUT = "update_workout"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    workout_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    user_id TEXT
+)
+"""
+# Lookups by workout/user are only used when several processes share the journal
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS pending_writes_workout ON pending_writes (workout_id) WHERE dead = 0",
+    "CREATE INDEX IF NOT EXISTS pending_writes_user ON pending_writes (user_id) WHERE dead = 0",
+)
+
+# Postgres error classes caused by the row itself (bad data, constraint, unknown column):
+# the same payload fails the same way every time
+PERMANENT_SQLSTATE_CLASSES = ("22", "23", "42")
+
+
+def is_permanent(error: Exception) -> bool:
+    """Whether a failed write can never succeed as-is, so retrying it only holds up the queue"""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    code = getattr(error, "code", None)
+    if status is None and isinstance(code, int):
+        # postgrest's APIError carries the HTTP status when the body wasn't JSON
+        status = code
+    if status is not None:
+        return 400 <= status < 500 and status not in (401, 403, 408, 429)
+    code = str(code or "")
+    if code.startswith("PGRST"):
+        # PGRST1xx: malformed request, PGRST2xx: unknown table/column; the rest are connection/auth
+        return code[5:6] in ("1", "2")
+    return len(code) == 5 and code[:2] in PERMANENT_SQLSTATE_CLASSES
+
+
+class WriteBehindQueue:
+    """Accepts writes instantly, flushes them in order from a background task, and serves unflushed rows"""
+
+    def __init__(
+        self,
+        workout_repo,
+        path: str = WRITE_BEHIND_PATH,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS
+    ):
+        self.workout_repo = workout_repo
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Set when Supabase itself is failing: every write waits, not just the one that hit it
+        self._paused_until = 0.0
+        # Several processes append to one journal and serve reads from it; only the flusher sends
+        self.shared = False
+        self.flusher = True
+
+        # Read-your-writes overlay: full rows for unflushed inserts, merged changes for unflushed updates
+        self._rows: Dict[str, Dict] = {}
+        self._changes: Dict[str, Dict] = {}
+        self._pending_ops: Dict[str, int] = {}
+        self._unflushed_inserts: Set[str] = set()
+
+        self.flushed = 0
+        self.failed_attempts = 0
+
+    # ---------- journal ----------
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Only ever used from the event loop thread, one statement at a time
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pending_writes)")}
+            if "user_id" not in columns:
+                # Journal from before the column existed
+                self._conn.execute("ALTER TABLE pending_writes ADD COLUMN user_id TEXT")
+            for index in INDEXES:
+                self._conn.execute(index)
+        return self._conn
+
+    def share(self, flusher: bool):
+        """Called in each pre-forked worker: the journal (and so read-your-writes) is shared by all of them"""
+        self.shared = True
+        self.flusher = flusher
+
+    def _track(self, op: str, workout_id: str, payload: Dict):
+        if op == INSERT_WORKOUT:
+            self._rows[workout_id] = dict(payload)
+            self._unflushed_inserts.add(workout_id)
+        elif workout_id in self._rows:
+            self._rows[workout_id].update(payload)
+        else:
+            self._changes.setdefault(workout_id, {}).update(payload)
+        self._pending_ops[workout_id] = self._pending_ops.get(workout_id, 0) + 1
+
+    def _untrack(self, op: str, workout_id: str):
+        if self.shared:
+            return
+        if op == INSERT_WORKOUT:
+            self._unflushed_inserts.discard(workout_id)
+        remaining = self._pending_ops.get(workout_id, 0) - 1
+        if remaining > 0:
+            self._pending_ops[workout_id] = remaining
+            return
+        self._pending_ops.pop(workout_id, None)
+        self._unflushed_inserts.discard(workout_id)
+        self._rows.pop(workout_id, None)
+        self._changes.pop(workout_id, None)
+
+    def _append(self, entries: List[tuple]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO pending_writes (op, workout_id, payload, user_id) VALUES (?, ?, ?, ?)",
+                [(op, workout_id, json.dumps(payload), payload.get("user_id")) for op, workout_id, payload in entries]
+            )
+        if self.shared:
+            return
+        for op, workout_id, payload in entries:
+            self._track(op, workout_id, payload)
+        if self.depth() >= self.batch_size:
+            self._wakeup.set()
+
+    def enqueue_insert(self, row: Dict):
+        self._append([(INSERT_WORKOUT, row["workout_id"], row)])
+
+    def enqueue_inserts(self, rows: List[Dict]):
+        self._append([(INSERT_WORKOUT, row["workout_id"], row) for row in rows])
+
+    def enqueue_update(self, workout_id: str, changes: Dict):
+        self._append([(UPDATE_WORKOUT, workout_id, changes)])
+
+    def depth(self) -> int:
+        if self.shared:
+            return self.conn.execute("SELECT COUNT(*) FROM pending_writes WHERE dead = 0").fetchone()[0]
+        return sum(self._pending_ops.values())
+
+    # ---------- read-your-writes ----------
+    def _journaled(self, workout_id: str) -> Tuple[Optional[Dict], Dict]:
+        """(unflushed insert with later updates applied, or None; merged unflushed updates) from the journal"""
+        row: Optional[Dict] = None
+        changes: Dict = {}
+        for op, payload in self.conn.execute(
+            "SELECT op, payload FROM pending_writes WHERE workout_id = ? AND dead = 0 ORDER BY id",
+            (workout_id,)
+        ):
+            if op == INSERT_WORKOUT:
+                row = json.loads(payload)
+            elif row is not None:
+                row.update(json.loads(payload))
+            else:
+                changes.update(json.loads(payload))
+        return row, changes
+
+    def pending_row(self, workout_id: str) -> Optional[Dict]:
+        """A workout whose insert hasn't reached Supabase yet"""
+        if self.shared:
+            return self._journaled(workout_id)[0]
+        if workout_id not in self._unflushed_inserts:
+            return None
+        return dict(self._rows[workout_id])
+
+    def with_pending_changes(self, row: Optional[Dict]) -> Optional[Dict]:
+        """A Supabase row with any unflushed updates applied"""
+        if row is None:
+            return None
+        workout_id = row["workout_id"]
+        if self.shared:
+            pending, changes = self._journaled(workout_id)
+            changes = pending or changes
+        else:
+            changes = self._rows.get(workout_id) or self._changes.get(workout_id)
+        return {**row, **changes} if changes else row
+
+    def pending_rows_for_user(self, user_id: str) -> List[Dict]:
+        """This user's workouts that aren't in Supabase yet"""
+        if self.shared:
+            workout_ids = [r[0] for r in self.conn.execute(
+                "SELECT DISTINCT workout_id FROM pending_writes WHERE user_id = ? AND op = ? AND dead = 0",
+                (user_id, INSERT_WORKOUT)
+            )]
+            return [row for row in (self._journaled(w)[0] for w in workout_ids) if row is not None]
+        return [
+            dict(self._rows[workout_id])
+            for workout_id in self._unflushed_inserts
+            if self._rows[workout_id].get("user_id") == user_id
+        ]
+
+    # ---------- flushing ----------
+    def _due(self) -> List[tuple]:
+        """Oldest writes that may go now; one that is backing off holds back only later writes to its workout"""
+        now = time.time()
+        due: List[tuple] = []
+        waiting: Set[str] = set()
+        cursor = self.conn.execute(
+            "SELECT id, op, workout_id, payload, attempts, next_attempt_at FROM pending_writes "
+            "WHERE dead = 0 ORDER BY id"
+        )
+        try:
+            for entry in cursor:
+                if entry[2] in waiting:
+                    continue
+                if entry[5] > now:
+                    waiting.add(entry[2])
+                    continue
+                due.append(entry)
+                if len(due) >= self.batch_size:
+                    break
+        finally:
+            cursor.close()
+        return due
+
+    def _done(self, entries: List[tuple]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM pending_writes WHERE id = ?", [(e[0],) for e in entries])
+        for entry in entries:
+            self._untrack(entry[1], entry[2])
+        self.flushed += len(entries)
+
+    def _failed(self, entries: List[tuple], error: Exception):
+        permanent = is_permanent(error)
+        self.failed_attempts += len(entries)
+        now = time.time()
+        updates = []
+        dead_entries = []
+        retry_in = WRITE_BEHIND_MAX_BACKOFF_SECONDS
+        for entry in entries:
+            attempts = entry[4] + 1
+            delay = min(WRITE_BEHIND_BACKOFF_SECONDS * (2 ** attempts), WRITE_BEHIND_MAX_BACKOFF_SECONDS)
+            dead = permanent or attempts >= self.max_attempts
+            updates.append((attempts, now + delay, int(dead), str(error), entry[0]))
+            if dead:
+                dead_entries.append((entry, attempts))
+            else:
+                retry_in = min(retry_in, delay)
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE pending_writes SET attempts = ?, next_attempt_at = ?, dead = ?, last_error = ? WHERE id = ?",
+                updates
+            )
+
+        for entry, attempts in dead_entries:
+            logger.error(
+                "giving up on write",
+                extra={"op": entry[1], "workout_id": entry[2], "attempts": attempts,
+                       "permanent": permanent, "error": str(error)}
+            )
+            self._untrack(entry[1], entry[2])
+        if len(dead_entries) < len(entries):
+            self._paused_until = now + retry_in
+            logger.warning(
+                "write-behind flush failed, retrying",
+                extra={"writes": len(entries) - len(dead_entries), "retry_in_seconds": retry_in, "error": str(error)}
+            )
+
+    async def _upsert(self, inserts: List[tuple]) -> int:
+        """Bulk upsert; a batch rejected for its data is split until only the offending rows are left"""
+        try:
+            # Upsert so a retry after an ambiguous failure can't duplicate rows
+            await self.workout_repo.upsert_many([json.loads(e[3]) for e in inserts])
+        except Exception as e:
+            if len(inserts) == 1 or not is_permanent(e):
+                self._failed(inserts, e)
+                return 0
+            middle = len(inserts) // 2
+            flushed = await self._upsert(inserts[:middle])
+            if time.time() < self._paused_until:
+                return flushed
+            return flushed + await self._upsert(inserts[middle:])
+        self._done(inserts)
+        return len(inserts)
+
+    async def flush(self) -> int:
+        """Flush due writes in journal order; inserts go up in bulk. Returns how many were flushed."""
+        flushed = 0
+        while time.time() >= self._paused_until:
+            # Every pass flushes or fails at least one write, and a failed one isn't due again this pass
+            entries = self._due()
+            if not entries:
+                break
+
+            inserts = []
+            for entry in entries:
+                if entry[1] != INSERT_WORKOUT:
+                    break
+                inserts.append(entry)
+            if inserts:
+                flushed += await self._upsert(inserts)
+                continue
+
+            # Updates go one at a time, after any earlier write to the same workout
+            update = entries[0]
+            try:
+                await self.workout_repo.update(update[2], json.loads(update[3]))
+            except Exception as e:
+                self._failed([update], e)
+                continue
+            self._done([update])
+            flushed += 1
+        return flushed
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("write-behind flush error")
+
+    def _replay(self):
+        """Rebuild the read-your-writes overlay from entries left over by a previous run"""
+        for op, workout_id, payload in self.conn.execute(
+            "SELECT op, workout_id, payload FROM pending_writes WHERE dead = 0 ORDER BY id"
+        ):
+            self._track(op, workout_id, json.loads(payload))
+        if self._pending_ops:
+            logger.info("replaying unflushed writes from the journal", extra={"pending": self.depth()})
+
+    async def start(self):
+        if not self.shared:
+            self._replay()
+        if self.flusher and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        try:
+            if self.flusher:
+                await self.flush()
+        except Exception as e:
+            logger.warning("final write-behind flush failed, entries stay journaled", extra={"error": str(e)})
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict:
+        dead = self.conn.execute("SELECT COUNT(*) FROM pending_writes WHERE dead = 1").fetchone()[0]
+        return {
+            "pending": self.depth(),
+            "dead": dead,
+            "flushed": self.flushed,
+            "failed_attempts": self.failed_attempts,
+            "shared": self.shared,
+            "flusher": self.flusher,
+        }
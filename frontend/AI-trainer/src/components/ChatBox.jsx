@@ -5,6 +5,7 @@ import './ChatBox.css';
 function ChatBox({ messages, setMessages, uploadedImage }) {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
+  const [conversationId, setConversationId] = useState(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -144,7 +145,8 @@ function ChatBox({ messages, setMessages, uploadedImage }) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           messages: [...messages, userMessage],
-          image: uploadedImage
+          image: uploadedImage,
+          conversation_id: conversationId
         })
       });
 
@@ -153,7 +155,10 @@ function ChatBox({ messages, setMessages, uploadedImage }) {
       }
 
       const data = await response.json();
-      
+      if (data.conversation_id) {
+        setConversationId(data.conversation_id);
+      }
+
       setMessages(prev => [...prev, {
         role: 'assistant',
         content: data.content